@@ -3,15 +3,22 @@
 import os
 import sys
 import time
+import socket
 import logging
-from functools import lru_cache
-from flask import Flask, render_template, request, jsonify
+import threading
+from collections import Counter
+from flask import Flask, Response, g, render_template, request, jsonify
+from werkzeug.serving import make_server
 
 lib_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(lib_path)
 
 from ccquery import define_level
 from ccquery.spelling import B1Correction
+from ccquery.utils import str_utils, process_utils
+from ccquery.utils.cache_utils import create_cache
+from ccquery.utils.concurrency_utils import SingleFlight, MicroBatcher
+from ccquery.utils.metric_utils import Histogram, Exposition
 
 #==================================================
 # Configuration
@@ -41,28 +48,106 @@ model_config = app.config['CCQUERY']
 #==================================================
 
 ctool = B1Correction()
-ctool.load_spacy(
-    model_config['spacy']['model'],
-    model_config['spacy'].get('disable'))
-ctool.load_hunspell(
-    model_config['hunspell']['dic'],
-    model_config['hunspell']['aff'],
-    model_config['hunspell'].get('extra'))
-ctool.load_ngram(
-    model_config['ngram']['model'],
-    **model_config['ngram'].get('kwargs'))
+ctool.load_config(model_config)
 
 #==================================================
 # Define API
 #==================================================
 
-@lru_cache()
+# corrections keyed by the normalized queries (case, white spaces),
+# computed from the queries as received
+cache = create_cache(
+    app.config.get('CACHE_SIZE', 100000),
+    policy=app.config.get('CACHE_POLICY', 'lru'),
+    ttl=app.config.get('CACHE_TTL'))
+
+# concurrent corrections of the same query computed only once
+flight = SingleFlight()
+
+def correct_items(items):
+    topn = max(item[1] for item in items)
+    results = ctool.correct_batch([item[0] for item in items], topn=topn)
+    return [result[:item[1]] for item, result in zip(items, results)]
+
+# optionally, queue the single-query corrections into micro-batches
+if app.config.get('MICRO_BATCH_SIZE'):
+    batcher = MicroBatcher(
+        correct_items,
+        max_batch_size=app.config['MICRO_BATCH_SIZE'],
+        max_wait=app.config.get('MICRO_BATCH_WAIT', 0.005))
+else:
+    batcher = None
+
+def correct_and_cache(key, query):
+    if batcher is not None:
+        corrections = batcher.submit((query, key[1]))
+    else:
+        corrections = ctool.correct(query, key[1])
+    cache.put(key, corrections)
+    return corrections
+
 def autocorrect(query, topn=1):
-    corrections = ctool.correct(query, topn)
+    key = (str_utils.normalize_query(query), topn)
+    corrections = cache.get(key)
+    if corrections is None:
+        corrections = flight.do(key, correct_and_cache, key, query)
+
     if topn == 1:
         return corrections[0]
     return corrections
 
+def autocorrect_within(query, budget):
+    key = (str_utils.normalize_query(query), 1)
+    corrections = cache.get(key)
+    if corrections is not None:
+        return corrections[0], 'full'
+
+    # corrected one by one, never within a micro-batch (no time budget),
+    # only cache the corrections that were not degraded
+    corrections, details = ctool.correct_with_details(
+        query, topn=1, budget=budget)
+    if details['degradation'] == 'full':
+        cache.put(key, corrections)
+    return corrections[0], details['degradation']
+
+def autocorrect_batch(queries, topn=1):
+    keys = [(str_utils.normalize_query(query), topn) for query in queries]
+    corrections = {key: cache.get(key) for key in dict.fromkeys(keys)}
+
+    # correct the cache misses together (first query of each key)
+    missing = {}
+    for key, query in zip(keys, queries):
+        if corrections[key] is None:
+            missing.setdefault(key, query)
+    if missing:
+        results = ctool.correct_batch(list(missing.values()), topn=topn)
+        for key, result in zip(missing, results):
+            corrections[key] = result
+            cache.put(key, result)
+
+    if topn == 1:
+        return [corrections[key][0] for key in keys]
+    return [corrections[key] for key in keys]
+
+# number of requests by (endpoint, status), durations by endpoint
+request_counts = Counter()
+request_durations = {}
+request_lock = threading.Lock()
+
+@app.before_request
+def start_request():
+    g.tstart = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unknown'
+    duration = time.perf_counter() - g.get('tstart', time.perf_counter())
+    with request_lock:
+        request_counts[(endpoint, response.status_code)] += 1
+        histogram = request_durations.setdefault(endpoint, Histogram())
+    histogram.observe(duration)
+    return response
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     bm = request.accept_mimetypes.best_match(['application/json', 'text/html'])
@@ -76,8 +161,23 @@ def index():
     else:
         return '', 406
 
+    # optionally, report the per-stage timings (bypasses the cache)
+    details = request.values.get('details', '').lower() in ('1', 'true')
+
+    # optionally, degrade the correction to fit a time budget (in seconds)
+    budget = request.values.get('budget', type=float) \
+        or app.config.get('LATENCY_BUDGET')
+
     tstart = time.monotonic()
-    clean_query = autocorrect(noisy_query)
+    if details:
+        corrections, correction_details = ctool.correct_with_details(
+            noisy_query, topn=1, budget=budget)
+        clean_query = corrections[0]
+        degradation = correction_details['degradation']
+    elif budget:
+        clean_query, degradation = autocorrect_within(noisy_query, budget)
+    else:
+        clean_query = autocorrect(noisy_query)
     clean_time = round(time.monotonic() - tstart, 3)
 
     response = {
@@ -85,14 +185,141 @@ def index():
         "clean_query": clean_query,
         "clean_time": clean_time}
 
+    if budget:
+        response["degradation"] = degradation
+    if details:
+        response["details"] = correction_details
+
     if bm == 'text/html':
         return render_template(form_template, **response)
     elif bm == 'application/json':
         return jsonify(**response)
 
+@app.route('/batch', methods=['POST'])
+def batch():
+    data = request.get_json(silent=True)
+
+    # either a list of queries or {"queries": [...], "topn": 1}
+    if isinstance(data, list):
+        data = {'queries': data}
+    if not isinstance(data, dict) or not isinstance(data.get('queries'), list):
+        return jsonify(error='expects a JSON array of queries'), 400
+
+    queries = data['queries']
+    topn = data.get('topn', 1)
+    if not all(isinstance(query, str) for query in queries) \
+            or not isinstance(topn, int) or topn < 1:
+        return jsonify(error='expects string queries and a positive topn'), 400
+    if len(queries) > app.config.get('BATCH_MAX_QUERIES', 10000):
+        return jsonify(error='too many queries'), 413
+
+    tstart = time.monotonic()
+    corrections = autocorrect_batch(queries, topn=topn)
+    clean_time = round(time.monotonic() - tstart, 3)
+
+    return jsonify(
+        results=[
+            {"query": query, "clean_query": clean}
+            for query, clean in zip(queries, corrections)],
+        clean_time=clean_time)
+
+# master process of the pre-forked workers (None in single-process mode)
+master_pid = None
+
+def workers_memory():
+    pids = process_utils.children(master_pid) if master_pid else []
+    return {
+        pid: process_utils.memory_usage(pid)
+        for pid in pids or [os.getpid()]}
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    response = {
+        "correction": ctool.stats(),
+        "cache": cache.stats(),
+        "coalescing": flight.stats()}
+    if batcher is not None:
+        response["batching"] = batcher.stats()
+
+    # the statistics above are those of the worker answering the request
+    response["worker"] = os.getpid()
+    response["workers"] = app.config.get('WORKERS', 1)
+    response["memory"] = {
+        str(pid): usage for pid, usage in workers_memory().items()}
+    return jsonify(**response)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # every sample is labelled by the worker answering the request
+    # (each worker keeps its own statistics)
+    exposition = ctool.metrics(
+        exposition=Exposition(labels={'worker': os.getpid()}),
+        caches=[({'cache': 'api'}, cache.stats())])
+
+    with request_lock:
+        counts = sorted(request_counts.items())
+        durations = sorted(request_durations.items())
+
+    exposition.counter(
+        'requests', 'Number of API requests',
+        [({'endpoint': endpoint, 'status': status}, count)
+         for (endpoint, status), count in counts])
+    exposition.histogram(
+        'request_duration_seconds', 'Duration of the API requests',
+        [({'endpoint': endpoint}, histogram)
+         for endpoint, histogram in durations])
+
+    coalescing = flight.stats()
+    exposition.counter(
+        'coalesced_corrections',
+        'Number of corrections awaited from an identical request in flight',
+        coalescing['coalesced'])
+    exposition.gauge(
+        'corrections_in_flight', 'Number of corrections in flight',
+        coalescing['in_flight'])
+
+    if batcher is not None:
+        exposition.histogram(
+            'micro_batch_size', 'Number of queries per micro-batch',
+            batcher.batch_sizes)
+        exposition.histogram(
+            'micro_batch_wait_seconds',
+            'Queueing delay of the queries before their micro-batch',
+            batcher.waits)
+
+    exposition.gauge(
+        'worker_memory_bytes', 'Resident memory of the API workers',
+        [({'pid': pid, 'measure': measure}, value)
+         for pid, usage in sorted(workers_memory().items()) if usage
+         for measure, value in sorted(usage.items())])
+
+    return Response(
+        exposition.render(),
+        mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 #==================================================
 # Run API
 #==================================================
 
+def serve_forever(listener, host, port):
+    server = make_server(
+        host, port, app, threaded=True, fd=listener.fileno())
+    server.serve_forever()
+
 if __name__ == '__main__':
-    app.run()
+    workers = app.config.get('WORKERS', 1)
+    if workers > 1:
+        # the models loaded above are shared by the forked workers,
+        # which accept the connections of the same socket
+        host, port = (app.config.get('SERVER_NAME') or
+                      '127.0.0.1:5000').split(':')
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, int(port)))
+        listener.listen(128)
+
+        master_pid = os.getpid()
+        process_utils.prefork(
+            lambda: serve_forever(listener, host, int(port)), workers)
+    else:
+        app.run()
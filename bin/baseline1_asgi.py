@@ -0,0 +1,342 @@
+#!/usr/bin/python3
+
+"""
+Asynchronous (ASGI) variant of the baseline1 REST API
+
+Run with an ASGI server, e.g.
+    CCQUERY_CONFIG=bin/baseline1.cfg uvicorn --app-dir bin baseline1_asgi:app
+"""
+
+import os
+import sys
+import json
+import time
+import runpy
+import asyncio
+import logging
+from functools import partial
+from multiprocessing import get_context
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import parse_qs
+from jinja2 import Environment, FileSystemLoader
+
+lib_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(lib_path)
+
+from ccquery import define_level
+from ccquery.spelling import B1Correction
+from ccquery.utils import str_utils
+from ccquery.utils.cache_utils import create_cache
+
+#==================================================
+# Configuration
+#==================================================
+
+# change logging level
+define_level(logging.ERROR)
+
+form_template = 'form.html'
+
+file_config = os.environ.get(
+    'CCQUERY_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline1.cfg'))
+
+# same configuration file as the Flask-based API
+config = {
+    key: value for key, value in runpy.run_path(file_config).items()
+    if key.isupper()}
+model_config = config['CCQUERY']
+
+# same form as the Flask-based API
+templates = Environment(
+    loader=FileSystemLoader(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'templates')),
+    autoescape=True)
+
+#==================================================
+# Load models
+#==================================================
+
+ctool = B1Correction()
+ctool.load_config(model_config)
+
+# corrections keyed by the normalized queries (case, white spaces),
+# computed from the queries as received
+cache = create_cache(
+    config.get('CACHE_SIZE', 100000),
+    policy=config.get('CACHE_POLICY', 'lru'),
+    ttl=config.get('CACHE_TTL'))
+
+#==================================================
+# Off-loop correction
+#==================================================
+
+def correct(query, topn=1):
+    return ctool.correct(query, topn)
+
+def correct_with_details(query, topn=1, budget=None):
+    return ctool.correct_with_details(query, topn=topn, budget=budget)
+
+# the corrections run on a bounded pool of threads, or of processes
+# forked after loading the models (sharing their memory pages),
+# started before serving the requests (see lifespan)
+workers = config.get('ASYNC_WORKERS', os.cpu_count())
+executor = None
+
+# at most 'queue_size' corrections queued or running (HTTP 503 beyond),
+# at most 'timeout' seconds per correction (HTTP 504 beyond)
+queue_size = config.get('ASYNC_QUEUE_SIZE', 100)
+timeout = config.get('ASYNC_TIMEOUT', 1.0)
+
+counters = {'pending': 0, 'rejected': 0, 'timeouts': 0}
+
+# corrections in flight by key, awaited by the identical requests
+flights = {}
+coalescing = {'executions': 0, 'coalesced': 0}
+
+async def start_executor():
+    global executor
+    if executor is not None:
+        return
+
+    if config.get('ASYNC_EXECUTOR', 'thread') == 'process':
+        executor = ProcessPoolExecutor(workers, mp_context=get_context('fork'))
+    else:
+        executor = ThreadPoolExecutor(workers)
+
+    # fork (or start) every worker before serving the requests
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[
+        loop.run_in_executor(executor, os.getpid) for _ in range(workers)])
+
+def release(future):
+    # the pending count is released once the correction stops running
+    # (the timeout does not interrupt a running correction)
+    counters['pending'] -= 1
+
+class Overloaded(Exception):
+    """Raised when too many corrections are pending"""
+
+def submit(function, *args):
+    # only the new corrections are rejected (the cached or coalesced
+    # queries are answered whatever the number of pending corrections)
+    if counters['pending'] >= queue_size:
+        counters['rejected'] += 1
+        raise Overloaded()
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, function, *args)
+    counters['pending'] += 1
+    future.add_done_callback(release)
+    return future
+
+def finish(key, future):
+    # cache the correction even if its requests timed out
+    flights.pop(key, None)
+    if not future.cancelled() and future.exception() is None:
+        cache.put(key, future.result())
+
+async def autocorrect(query, topn=1):
+    key = (str_utils.normalize_query(query), topn)
+    corrections = cache.get(key)
+    if corrections is None:
+        # concurrent corrections of the same query computed only once
+        future = flights.get(key)
+        if future is None:
+            future = flights[key] = submit(correct, query, topn)
+            future.add_done_callback(partial(finish, key))
+            coalescing['executions'] += 1
+        else:
+            coalescing['coalesced'] += 1
+
+        corrections = await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    if topn == 1:
+        return corrections[0]
+    return corrections
+
+async def autocorrect_within(query, budget):
+    key = (str_utils.normalize_query(query), 1)
+    corrections = cache.get(key)
+    if corrections is not None:
+        return corrections[0], 'full'
+
+    # only cache the corrections that were not degraded
+    corrections, details = await asyncio.wait_for(
+        asyncio.shield(submit(correct_with_details, query, 1, budget)),
+        timeout)
+    if details['degradation'] == 'full':
+        cache.put(key, corrections)
+    return corrections[0], details['degradation']
+
+#==================================================
+# Define API
+#==================================================
+
+def best_match(accept, offers):
+    """
+    Return the offered media type of highest quality
+    within the Accept header (the first offer on ties), None if none
+    """
+
+    best, best_quality = None, 0
+    for offer in offers:
+        for item in accept.split(','):
+            media, *params = [part.strip() for part in item.split(';')]
+            quality = 1.0
+            for param in params:
+                name, _, value = param.partition('=')
+                if name.strip() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+
+            if media in (offer, '*/*', offer.split('/')[0] + '/*') \
+                    and quality > best_quality:
+                best, best_quality = offer, quality
+    return best
+
+async def read_body(receive):
+    body = b''
+    more = True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+    return body
+
+async def send_response(send, status, body, content_type, headers=None):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode())] + (headers or [])})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_json(send, status, data, headers=None):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    await send_response(
+        send, status, body, 'application/json; charset=utf-8', headers)
+
+async def send_form(send, **response):
+    body = templates.get_template(form_template).render(**response)
+    await send_response(
+        send, 200, body.encode('utf-8'), 'text/html; charset=utf-8')
+
+async def index(scope, receive, send):
+    headers = dict(scope['headers'])
+    accept = headers.get(b'accept', b'*/*').decode('latin-1')
+    bm = best_match(accept, ['application/json', 'text/html'])
+    if bm == 'text/html' and scope['method'] == 'GET':
+        return await send_form(send)
+
+    args = parse_qs(
+        scope['query_string'].decode('utf-8'), keep_blank_values=True)
+    form = {}
+    content_type = headers.get(b'content-type', b'').decode('latin-1')
+    if scope['method'] == 'POST' \
+            and content_type.startswith('application/x-www-form-urlencoded'):
+        body = await read_body(receive)
+        form = parse_qs(body.decode('utf-8'), keep_blank_values=True)
+    values = dict(form, **args)
+
+    if bm == 'text/html':
+        noisy_query = form.get('query')
+    elif bm == 'application/json':
+        noisy_query = args.get('query')
+    else:
+        return await send_response(send, 406, b'', 'text/plain')
+
+    if noisy_query is None:
+        return await send_json(send, 400, {'error': 'expects a query'})
+    noisy_query = noisy_query[0]
+
+    # optionally, report the per-stage timings (bypasses the cache)
+    details = values.get('details', [''])[0].lower() in ('1', 'true')
+
+    # optionally, degrade the correction to fit a time budget (in seconds)
+    try:
+        budget = float(values.get('budget', [''])[0])
+    except ValueError:
+        budget = None
+    budget = budget or config.get('LATENCY_BUDGET')
+
+    tstart = time.monotonic()
+    try:
+        if details:
+            corrections, correction_details = await asyncio.wait_for(
+                asyncio.shield(submit(
+                    correct_with_details, noisy_query, 1, budget)),
+                timeout)
+            clean_query = corrections[0]
+            degradation = correction_details['degradation']
+        elif budget:
+            clean_query, degradation = await autocorrect_within(
+                noisy_query, budget)
+        else:
+            clean_query = await autocorrect(noisy_query)
+    except Overloaded:
+        return await send_json(
+            send, 503, {'error': 'too many pending queries'},
+            headers=[(b'retry-after', b'1')])
+    except asyncio.TimeoutError:
+        counters['timeouts'] += 1
+        return await send_json(send, 504, {'error': 'correction timed out'})
+    clean_time = round(time.monotonic() - tstart, 3)
+
+    response = {
+        "query": noisy_query,
+        "clean_query": clean_query,
+        "clean_time": clean_time}
+
+    if budget:
+        response["degradation"] = degradation
+    if details:
+        response["details"] = correction_details
+
+    if bm == 'text/html':
+        return await send_form(send, **response)
+    await send_json(send, 200, response)
+
+async def stats(scope, receive, send):
+    # the correction statistics are kept by the worker processes
+    # of the process pool, hence only reported for the thread pool
+    response = {
+        "cache": cache.stats(),
+        "coalescing": dict(coalescing, in_flight=len(flights)),
+        "service": dict(counters)}
+    if isinstance(executor, ThreadPoolExecutor):
+        response["correction"] = ctool.stats()
+    await send_json(send, 200, response)
+
+routes = {
+    ('/', 'GET'): index,
+    ('/', 'POST'): index,
+    ('/stats', 'GET'): stats,
+}
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await start_executor()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    if executor is None:
+        # ASGI server without lifespan support
+        await start_executor()
+
+    route = routes.get((scope['path'], scope['method']))
+    if route is None:
+        return await send_json(send, 404, {'error': 'not found'})
+    await route(scope, receive, send)
@@ -1,2 +1,4 @@
 from .arpa_lm import ArpaLanguageModel
+from .compact_lm import CompactModel
 from .lm import LanguageModel
+from . import quantization
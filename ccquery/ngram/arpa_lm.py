@@ -1,7 +1,10 @@
 import re
 import logging
+from array import array
 from marisa_trie import RecordTrie
 from ccquery.utils import io_utils
+from ccquery.ngram import quantization
+from ccquery.ngram.compact_lm import CompactWriter
 
 class ArpaLanguageModel:
     """
@@ -10,28 +13,97 @@ class ArpaLanguageModel:
 
     Focus:
     - load pre-computed back-off language model from file in ARPA format
+      (plain text or compressed: gz, bz2, xz)
     - build a trie on (ngram, (logprob, backoff)) entries (use marisa_trie)
     - store the trie model in binary file (usefull for faster reload)
+    - or store the n-grams under the compact integer-ID format
+      (memory-mapped when reloaded, see CompactModel)
+    - optionally quantize the (logprob, backoff) values on 8 or 16 bits
+      (per-order codebooks, stored next to the trie-based model)
 
     Note:
-    - might require a lot of memory depending on the size of the language model
+    - the trie might require a lot of memory depending on the size of the model
+      (the compact format can be built within a bounded memory)
     - use only once
     """
 
-    def __init__(self, path):
-        """Build trie on ARPA n-grams"""
+    def __init__(self, path, build_trie=True, threads=None):
+        """
+        Build trie on ARPA n-grams.
+        Delay it until requested when build_trie is False
+        (e.g. when only the compact format is needed).
+        The ARPA file can be compressed (gz, bz2, xz): it is then streamed
+        through a decompressor using the given number of threads.
+        """
 
         io_utils.check_file_readable(path)
         self.logger = logging.getLogger(__name__)
         self.logger.info("Load ARPA model from {}".format(path))
 
+        self.path = path
+        self.threads = threads
         self.order = None
         self.total = {}
-        self.trie = RecordTrie("@dd", self.load_ngram_tuples(path))
+        self.trie = None
+        self.bits = None
+        self.codebooks = None
+
+        if build_trie:
+            self.build_trie()
+
+    def build_trie(self, bits=None):
+        """
+        Build the trie on (ngram, (logprob, backoff)) entries.
+        If requested, store the 'bits'-quantized values instead
+        (requires an extra pass on the ARPA file to define the codebooks).
+        """
+
+        if bits:
+            self.codebooks = self.build_codebooks(bits)
+            encoder = quantization.Encoder(self.codebooks)
+            self.trie = RecordTrie(
+                quantization.HEADERS[bits],
+                ((ngram, encoder(ngram.count(' ') + 1, *values))
+                 for ngram, values in self.load_ngram_tuples(self.path)))
+        else:
+            self.codebooks = None
+            self.trie = RecordTrie("@dd", self.load_ngram_tuples(self.path))
+
+        self.bits = bits
 
         self.logger.info(
             "Loaded a {}-gram LM with {} counts".format(self.order, self.total))
 
+    def build_codebooks(self, bits):
+        """
+        Define the per-order codebooks of the log-probabilities
+        and back-off weights, quantized on given number of bits
+        """
+
+        quantization.check_bits(bits)
+
+        values = {}
+        for ngram, (logprob, backoff) in self.load_ngram_tuples(self.path):
+            order = ngram.count(' ') + 1
+            if order not in values:
+                values[order] = (array('d'), array('d'))
+            values[order][0].append(logprob)
+            values[order][1].append(backoff)
+
+        codebooks = {}
+        for order, (logprobs, backoffs) in values.items():
+            codebooks[(order, 'prob')] = quantization.build_codebook(
+                logprobs, bits)
+            codebooks[(order, 'backoff')] = quantization.build_codebook(
+                backoffs, bits)
+            self.logger.info(
+                "Quantized {}-grams with {} logprob and {} backoff values".format(
+                    order,
+                    len(codebooks[(order, 'prob')]),
+                    len(codebooks[(order, 'backoff')])))
+
+        return codebooks
+
     def load_ngram_tuples(self, path):
         """
         Process ARPA language model.
@@ -41,7 +113,7 @@ class ArpaLanguageModel:
         order = None
         self.total = {}
 
-        with open(path, 'rt', encoding='utf-8') as istream:
+        with io_utils.open_text(path, threads=self.threads) as istream:
             for line in istream:
                 line = line.strip()
                 if line:
@@ -75,6 +147,32 @@ class ArpaLanguageModel:
 
         self.order = order
 
-    def save_trie(self, output):
-        """Store trie-based n-grams under binary format"""
+    def save_trie(self, output, bits=None):
+        """
+        Store trie-based n-grams under binary format.
+        Quantized models also store their codebooks
+        (see quantization.codebook_path).
+        """
+
+        if self.trie is None or self.bits != bits:
+            self.build_trie(bits)
         self.trie.save(output)
+
+        if self.codebooks:
+            quantization.save_codebooks(
+                self.codebooks, quantization.codebook_path(output))
+
+    def save_compact(self, output, bits=None, memory=1024, tmpdir=None):
+        """
+        Store the n-grams under the compact integer-ID binary format,
+        with quantized values if requested.
+        Stream the ARPA file and sort the n-grams within the memory budget
+        (in MB), using temporary files if needed (see CompactWriter).
+        """
+
+        with CompactWriter(
+                output, bits=bits, memory=memory, tmpdir=tmpdir) as writer:
+            writer.write(self.load_ngram_tuples(self.path))
+
+        self.logger.info(
+            "Stored a {}-gram LM with {} counts".format(self.order, self.total))
@@ -0,0 +1,461 @@
+import os
+import json
+import mmap
+import time
+import struct
+import logging
+import tempfile
+from itertools import groupby
+import numpy as np
+from marisa_trie import Trie
+from ccquery.error import DataError
+from ccquery.utils import io_utils
+from ccquery.ngram import quantization
+
+MAGIC = b'CCQLM\x00v1'
+ALIGNMENT = 8
+
+# size of a (packed key, logprob, backoff) entry
+ENTRY_SIZE = 8 + 4 + 4
+
+# maximum number of values defining a quantization codebook
+SAMPLE_SIZE = 2 ** 20
+
+def is_compact(path):
+    """Check if given file stores a compact n-gram language model"""
+    with open(path, 'rb') as istream:
+        return istream.read(len(MAGIC)) == MAGIC
+
+def id_bits(vocab_size):
+    """Return the number of bits needed to encode a word ID"""
+    return max(1, (vocab_size - 1).bit_length())
+
+class CompactWriter:
+    """
+    Store n-gram entries under the compact integer-ID binary format
+
+    Format:
+    - magic string, followed by the offset of the json header
+    - the vocabulary, as a marisa trie mapping words to integer IDs
+    - for each order n, the arrays of
+        the n-gram keys (n word IDs packed into a sorted uint64)
+        the log-probabilities (float32)
+        the back-off weights (float32, absent for the highest order)
+      the unigram arrays are directly indexed by word ID (no keys)
+      the values can be quantized on 8 or 16 bits
+      (codes stored instead of values, along with per-order codebooks)
+    - the json header (order, counts, bits, offsets of each array)
+
+    Bounded memory (external sort):
+    - the n-grams are packed into chunks fitting the memory budget
+    - each chunk is sorted, then stored into a temporary folder
+    - the sorted chunks are merged block by block
+    - the codebooks of quantized values are defined on an evenly spaced
+      sample of at most SAMPLE_SIZE values (whatever the memory budget)
+
+    Note:
+    - expects the n-grams grouped by increasing order (as in ARPA files)
+    - keeps the vocabulary (and the unigrams) in memory
+    - use as a context manager, closing the output file on exit
+    """
+
+    def __init__(self, output, bits=None, memory=1024, tmpdir=None):
+        """
+        Open the output file, set the quantization bits (if any)
+        and the memory budget (in MB) used to sort the n-grams
+        """
+
+        self.logger = logging.getLogger(__name__)
+
+        if bits:
+            quantization.check_bits(bits)
+        self.bits = bits
+
+        # a chunk is sorted through a copy of its entries
+        self.chunk_size = max(1, int(memory * 2 ** 20) // (2 * ENTRY_SIZE))
+        self.tmpdir = tempfile.mkdtemp(prefix='ccquery-lm-', dir=tmpdir)
+
+        io_utils.create_path(output)
+        self.ostream = open(output, 'wb')
+        self.ostream.write(MAGIC)
+        self.ostream.write(struct.pack('<Q', 0))
+
+        self.header = {'order': 0, 'counts': {}, 'bits': 0, 'arrays': {}}
+        self.vocab = None
+        self.pending = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _align(self):
+        """Pad the output file up to the next aligned position"""
+        padding = -self.ostream.tell() % ALIGNMENT
+        self.ostream.write(b'\0' * padding)
+
+    def _write(self, name, data):
+        """Append aligned data, record its location in the header"""
+
+        self._align()
+
+        if isinstance(data, np.ndarray):
+            self.header['arrays'][name] = [
+                self.ostream.tell(), len(data), data.dtype.str]
+            data = data.tobytes()
+        else:
+            self.header['arrays'][name] = [self.ostream.tell(), len(data), '']
+
+        self.ostream.write(data)
+
+    def _write_blocks(self, name, data, codebook=None):
+        """
+        Append an aligned (memory-mapped) array block by block,
+        encoding its values with the codebook, if any
+        """
+
+        self._align()
+
+        dtype = data.dtype
+        if codebook is not None:
+            dtype = quantization.encode(data[:0], codebook).dtype
+
+        self.header['arrays'][name] = [
+            self.ostream.tell(), len(data), np.dtype(dtype).str]
+
+        for start in range(0, len(data), self.chunk_size):
+            block = data[start:start + self.chunk_size]
+            if codebook is not None:
+                block = quantization.encode(block, codebook)
+            self.ostream.write(np.ascontiguousarray(block).tobytes())
+
+    def _write_values(self, name, values):
+        """Append the (possibly quantized) values under given name"""
+
+        codebook = None
+        if self.bits:
+            # define the codebook on a sample of bounded size
+            step = max(1, -(-len(values) // SAMPLE_SIZE))
+            codebook = quantization.build_codebook(values[::step], self.bits)
+            self._write(name + '-codebook', codebook)
+
+        self._write_blocks(name, values, codebook)
+
+    def _tmpfile(self, name):
+        """Return the path of a temporary file"""
+        return os.path.join(self.tmpdir, name + '.npy')
+
+    def _word_ids(self, ngram):
+        """Return the list of IDs of the words within given n-gram"""
+
+        ids = []
+        for word in ngram.split():
+            wid = self.vocab.get(word)
+            if wid is None:
+                raise DataError(
+                    "Word '{}' of n-gram '{}' is not a known unigram".format(
+                        word, ngram))
+            ids.append(wid)
+        return ids
+
+    def pack(self, ngram):
+        """Pack the word IDs of given n-gram into a single integer key"""
+        key = 0
+        for wid in self._word_ids(ngram):
+            key = (key << self.header['bits']) | wid
+        return key
+
+    def write_unigrams(self, entries):
+        """Define the vocabulary and store the unigram arrays"""
+
+        entries = list(entries)
+        self.vocab = Trie([ngram for ngram, _ in entries])
+        self.header['bits'] = id_bits(len(self.vocab))
+
+        probs = np.zeros(len(self.vocab), dtype=np.float32)
+        backoffs = np.zeros(len(self.vocab), dtype=np.float32)
+        for ngram, (logprob, backoff) in entries:
+            probs[self.vocab[ngram]] = logprob
+            backoffs[self.vocab[ngram]] = backoff
+
+        self._write('vocab', self.vocab.tobytes())
+        self._write_values('1-prob', probs)
+
+        np.save(self._tmpfile('1-backoff'), backoffs)
+        self.pending = '1-backoff'
+
+        self.header['counts'][1] = len(self.vocab)
+        self.header['order'] = 1
+
+    def _sort_chunk(self, name, keys, probs, backoffs):
+        """Sort a chunk of entries by key, store it into temporary files"""
+
+        indexes = np.argsort(keys, kind='stable')
+        np.save(self._tmpfile(name + '-key'), keys[indexes])
+        np.save(self._tmpfile(name + '-prob'), probs[indexes])
+        np.save(self._tmpfile(name + '-backoff'), backoffs[indexes])
+        return name
+
+    def _load_chunk(self, name):
+        """Memory-map the (key, prob, backoff) arrays of a sorted chunk"""
+        return [
+            np.load(self._tmpfile(name + suffix), mmap_mode='r')
+            for suffix in ['-key', '-prob', '-backoff']]
+
+    def _merge_chunks(self, order, names):
+        """
+        Merge the sorted chunks block by block into temporary arrays:
+        each step merges the entries of each chunk up to the smallest
+        of the last keys of the current blocks
+        """
+
+        chunks = [self._load_chunk(name) for name in names]
+        count = sum(len(keys) for keys, _, _ in chunks)
+        block = max(1, self.chunk_size // len(chunks))
+
+        merged = [
+            np.lib.format.open_memmap(
+                self._tmpfile("{}{}".format(order, suffix)),
+                mode='w+', dtype=dtype, shape=(count,))
+            for suffix, dtype in [
+                ('-key', np.uint64),
+                ('-prob', np.float32),
+                ('-backoff', np.float32)]]
+
+        positions = [0] * len(chunks)
+        done = 0
+        while done < count:
+            active = [
+                i for i, (keys, _, _) in enumerate(chunks)
+                if positions[i] < len(keys)]
+
+            threshold = min(
+                chunks[i][0][min(positions[i] + block, len(chunks[i][0])) - 1]
+                for i in active)
+
+            parts = []
+            for i in active:
+                start = positions[i]
+                keys = chunks[i][0][start:start + block]
+                end = start + int(np.searchsorted(keys, threshold, 'right'))
+                parts.append([values[start:end] for values in chunks[i]])
+                positions[i] = end
+
+            parts = [np.concatenate(arrays) for arrays in zip(*parts)]
+            indexes = np.argsort(parts[0], kind='stable')
+            for target, values in zip(merged, parts):
+                target[done:done + len(indexes)] = values[indexes]
+            done += len(indexes)
+
+        for target in merged:
+            target.flush()
+
+        for name in names:
+            for suffix in ['-key', '-prob', '-backoff']:
+                io_utils.delete_file(self._tmpfile(name + suffix))
+
+        return count
+
+    def write_ngrams(self, order, entries):
+        """Sort the n-grams of given order by key and store their arrays"""
+
+        if self.vocab is None:
+            raise DataError('Unigrams must be stored before higher orders')
+
+        if self.header['bits'] * order > 64:
+            raise DataError(
+                "Cannot pack {}-grams of a {}-word vocabulary into 64 bits"
+                .format(order, len(self.vocab)))
+
+        tstart = time.monotonic()
+
+        keys = np.empty(self.chunk_size, dtype=np.uint64)
+        probs = np.empty(self.chunk_size, dtype=np.float32)
+        backoffs = np.empty(self.chunk_size, dtype=np.float32)
+
+        names, n, total = [], 0, 0
+        for ngram, (logprob, backoff) in entries:
+            keys[n] = self.pack(ngram)
+            probs[n] = logprob
+            backoffs[n] = backoff
+            n += 1
+
+            if n == self.chunk_size:
+                names.append(self._sort_chunk(
+                    "{}-chunk{}".format(order, len(names)),
+                    keys, probs, backoffs))
+                total, n = total + n, 0
+                self.logger.info(
+                    "Sorted {:,} {}-grams ({:,.0f} n-grams/s)".format(
+                        total, order, total / (time.monotonic() - tstart)))
+
+        if n or not names:
+            names.append(self._sort_chunk(
+                "{}-chunk{}".format(order, len(names)),
+                keys[:n], probs[:n], backoffs[:n]))
+
+        count = self._merge_chunks(order, names)
+        self.logger.info(
+            "Merged {:,} {}-grams from {} sorted chunk(s) in {:.1f}s".format(
+                count, order, len(names), time.monotonic() - tstart))
+
+        keys, probs, _ = self._load_chunk(str(order))
+        self._write_blocks("{}-key".format(order), keys)
+        self._write_values("{}-prob".format(order), probs)
+        del keys, probs
+        self.pending = "{}-backoff".format(order)
+
+        self.header['counts'][order] = count
+        self.header['order'] = order
+
+        self.logger.info(
+            "Stored {:,} {}-grams in {:.1f}s ({:,.0f} n-grams/s)".format(
+                count, order, time.monotonic() - tstart,
+                count / max(time.monotonic() - tstart, 1e-9)))
+
+    def write(self, ngram_tuples):
+        """
+        Store the (ngram, (logprob, backoff)) entries,
+        grouped by increasing order
+        """
+
+        for order, entries in groupby(
+                ngram_tuples, key=lambda entry: entry[0].count(' ') + 1):
+
+            # the back-off weights are only needed for the lower orders
+            if self.pending:
+                self._write_values(
+                    self.pending,
+                    np.load(self._tmpfile(self.pending), mmap_mode='r'))
+                self.pending = None
+
+            self.logger.info("Storing {}-grams".format(order))
+            if order == 1:
+                self.write_unigrams(entries)
+            else:
+                self.write_ngrams(order, entries)
+
+    def close(self):
+        """Store the json header, close the output file, remove temporary data"""
+
+        offset = self.ostream.tell()
+        self.ostream.write(json.dumps(self.header).encode('utf-8'))
+        self.ostream.seek(len(MAGIC))
+        self.ostream.write(struct.pack('<Q', offset))
+        self.ostream.close()
+
+        io_utils.delete_folder(self.tmpdir)
+
+class CompactModel:
+    """
+    Memory-map a n-gram language model stored under the compact format
+    (see CompactWriter)
+
+    Focus:
+    - near-instant load, the arrays are not copied into memory
+    - the memory pages are shared by the processes using the same file
+    - look up n-grams given as tuples of words (binary search on keys)
+    """
+
+    def __init__(self, path):
+        """Memory-map the model file"""
+
+        io_utils.check_file_readable(path)
+        if not is_compact(path):
+            raise DataError("File '{}' is not a compact n-gram model".format(
+                path))
+
+        with open(path, 'rb') as istream:
+            self.buffer = mmap.mmap(
+                istream.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offset = struct.unpack_from('<Q', self.buffer, len(MAGIC))[0]
+        header = json.loads(self.buffer[offset:].decode('utf-8'))
+
+        self.order = header['order']
+        self.total = {int(n): c for n, c in header['counts'].items()}
+        self.bits = header['bits']
+
+        self.arrays = {}
+        for name, (start, count, dtype) in header['arrays'].items():
+            if dtype:
+                self.arrays[name] = np.frombuffer(
+                    self.buffer, dtype=dtype, count=count, offset=start)
+
+        start, count, _ = header['arrays']['vocab']
+        self.vocab = Trie()
+        self.vocab.frombytes(self.buffer[start:start + count])
+
+        self.keys = [None] + [
+            self.arrays.get("{}-key".format(n))
+            for n in range(1, self.order + 1)]
+        self.probs = [None] + [
+            self.arrays["{}-prob".format(n)]
+            for n in range(1, self.order + 1)]
+        self.backoffs = [None] + [
+            self.arrays.get("{}-backoff".format(n))
+            for n in range(1, self.order + 1)]
+
+        # codebooks of quantized models (lists are faster to index)
+        self.prob_codebooks = [None] + [
+            self._codebook("{}-prob".format(n))
+            for n in range(1, self.order + 1)]
+        self.backoff_codebooks = [None] + [
+            self._codebook("{}-backoff".format(n))
+            for n in range(1, self.order + 1)]
+
+    def _codebook(self, name):
+        """Return the codebook of given array, None if not quantized"""
+        codebook = self.arrays.get(name + '-codebook')
+        if codebook is None:
+            return None
+        return codebook.tolist()
+
+    def _position(self, ngram):
+        """Return the array position of given n-gram tuple, None if absent"""
+
+        key = 0
+        for word in ngram:
+            wid = self.vocab.get(word)
+            if wid is None:
+                return None
+            key = (key << self.bits) | wid
+
+        if len(ngram) == 1:
+            return key
+
+        keys = self.keys[len(ngram)]
+        key = np.uint64(key)
+        pos = int(keys.searchsorted(key))
+        if pos < len(keys) and keys[pos] == key:
+            return pos
+        return None
+
+    def lookup(self, ngram):
+        """Return the (logprob, backoff) values of given n-gram, None if absent"""
+
+        if not ngram or len(ngram) > self.order:
+            return None
+
+        pos = self._position(ngram)
+        if pos is None:
+            return None
+
+        n = len(ngram)
+
+        logprob = self.probs[n][pos]
+        if self.prob_codebooks[n] is not None:
+            logprob = self.prob_codebooks[n][logprob]
+
+        backoff = 0.0
+        if self.backoffs[n] is not None:
+            backoff = self.backoffs[n][pos]
+            if self.backoff_codebooks[n] is not None:
+                backoff = self.backoff_codebooks[n][backoff]
+
+        return (float(logprob), float(backoff))
+
+    def __contains__(self, ngram):
+        """Check if given n-gram (string) is known by the model"""
+        return self.lookup(tuple(ngram.split())) is not None
@@ -1,6 +1,11 @@
+import heapq
 import logging
+from functools import lru_cache
+import numpy as np
 from marisa_trie import RecordTrie
 from ccquery.utils import io_utils
+from ccquery.ngram import quantization
+from ccquery.ngram.compact_lm import CompactModel, is_compact
 
 class LanguageModel:
     """
@@ -9,29 +14,104 @@ class LanguageModel:
 
     Focus:
     - fast load the n-gram trie from binary file
+      (or memory-map a model stored under the compact format)
+    - transparently dequantize the values of quantized models
+    - optionally cache the most recent n-gram lookups (bounded LRU cache)
     - compute the log-probabilities of n-grams
+    - extend word sequences one word at a time (state-based scoring)
     - reorder a sequence of n-grams by their log-probabilities
+      (shared prefixes are scored only once)
+    - decode a lattice of alternatives with a left-to-right beam search
+    - score large batches of sequences (vectorized back-off computation)
     """
 
-    def __init__(self, path, header="@dd", order=3, unk='<unk>'):
-        """Load language model from file"""
+    def __init__(
+            self, path, header="@dd", order=3, unk='<unk>', cache_size=None,
+            codebook=None, mmap=False):
+        """
+        Load language model from file.
+        Compact models are detected automatically
+        (their header and order are read from the file).
+        Trie-based models quantized on 8 or 16 bits (header '<BB' or '<HH')
+        also load their codebooks (default path next to the model).
+        Keep the (logprob, backoff) values of the 'cache_size' most recently
+        looked up n-grams in memory, if requested.
+        Memory-map the trie-based models instead of reading them,
+        if requested (the compact models are always memory-mapped):
+        the processes loading the same file share its pages.
+        """
 
         io_utils.check_file_readable(path)
 
         self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.codebooks = None
+
+        if is_compact(path):
+            self.model = CompactModel(path)
+            self.order = self.model.order
+            self._uncached_lookup = self.model.lookup
+        else:
+            self.model = RecordTrie(header)
+            if mmap:
+                self.model.mmap(path)
+            else:
+                self.model.load(path)
+            self.order = order
+
+            if header in quantization.HEADERS.values():
+                codebook = codebook or quantization.codebook_path(path)
+                io_utils.check_file_readable(codebook)
+                self.codebooks = quantization.load_codebooks(codebook)
+
+            self._uncached_lookup = self._lookup
 
-        self.order = order
-        self.model = RecordTrie(header)
-        self.model.load(path)
         self.unk = unk
 
+        self._cached_lookup = self._uncached_lookup
+        if cache_size:
+            self._cached_lookup = lru_cache(maxsize=cache_size)(
+                self._uncached_lookup)
+
+    def _lookup(self, ngram):
+        """Return the (logprob, backoff) values of given ngram, None if absent"""
+        try:
+            values = self.model[' '.join(ngram)][0]
+        except KeyError:
+            return None
+
+        if self.codebooks:
+            probs, backoffs = self.codebooks[len(ngram)]
+            return (probs[values[0]], backoffs[values[1]])
+        return values
+
     def _prob(self, ngram):
         """Return probability of given ngram tuple"""
-        return self.model[ngram][0][0]
+        values = self._cached_lookup(ngram)
+        if values is None:
+            raise KeyError(ngram)
+        return values[0]
 
     def _backoff(self, ngram):
         """Return backoff value of a given ngram tuple"""
-        return self.model[ngram][0][1]
+        values = self._cached_lookup(ngram)
+        if values is None:
+            raise KeyError(ngram)
+        return values[1]
+
+    def cache_info(self):
+        """
+        Return the (hits, misses, maxsize, currsize) statistics
+        of the n-gram cache, None if the cache is disabled
+        """
+        if self._cached_lookup is self._uncached_lookup:
+            return None
+        return self._cached_lookup.cache_info()
+
+    def clear_cache(self):
+        """Empty the n-gram cache and reset its statistics"""
+        if self._cached_lookup is not self._uncached_lookup:
+            self._cached_lookup.cache_clear()
 
     def has_word(self, word):
         """Check if given word is known by the model"""
@@ -39,14 +119,33 @@ class LanguageModel:
             return True
         return False
 
+    def unigrams(self):
+        """
+        Iterate over the (word, logprob) unigrams of the model
+        (the trie-based models are scanned entirely)
+        """
+
+        # bypass the n-gram cache
+        lookup = self._uncached_lookup
+
+        if isinstance(self.model, CompactModel):
+            words = self.model.vocab.iterkeys()
+        else:
+            words = (key for key in self.model.iterkeys() if ' ' not in key)
+
+        for word in words:
+            values = lookup((word,))
+            if values is not None:
+                yield word, float(values[0])
+
     def score_word(self, word):
         """Get the unigram log-probability of given word"""
 
         try:
-            return self._prob(word)
+            return self._prob((word,))
         except KeyError:
             try:
-                return self._prob(self.unk)
+                return self._prob((self.unk,))
             except KeyError:
                 raise KeyError(
                     "Word {} not found (model has no UNK token)".format(word))
@@ -63,15 +162,65 @@ class LanguageModel:
             lookup = lookup[-self.order:]
 
         try:
-            return self._prob(' '.join(lookup))
+            return self._prob(lookup)
         except KeyError:
             # not found, back off
             try:
-                backoffweight = self._backoff(' '.join(history))
+                backoffweight = self._backoff(history)
             except KeyError:
                 backoffweight = 0
             return backoffweight + self._score(word, history[1:])
 
+    def null_state(self):
+        """Return the state of an empty context"""
+        return ()
+
+    def begin_state(self, bos='<s>'):
+        """Return the state of a context holding the start-of-sentence token"""
+        if self._cached_lookup((bos,)) is None:
+            return self.null_state()
+        return (bos,)
+
+    def _next_state(self, ngram):
+        """Return the state following the given matched n-gram"""
+        return ngram[len(ngram) - self.order + 1:]
+
+    def score_state(self, state, word):
+        """
+        Get the log-probability of a word following the given state,
+        return it along with the state following the word
+
+        A state holds the longest context matched by the model
+        (at most 'order - 1' words, all of them known as an n-gram),
+        therefore the back-off weights of the shorter contexts
+        are the only extra look-ups needed.
+        Same values as _score(word, history), where 'state' would be
+        the state reached after scoring the history.
+        """
+
+        backoffs = []
+        for size in range(len(state), 0, -1):
+            context = state[len(state) - size:]
+            values = self._cached_lookup(context + (word,))
+            if values is not None:
+                logprob, state = values[0], self._next_state(context + (word,))
+                break
+            values = self._cached_lookup(context)
+            backoffs.append(values[1] if values is not None else 0)
+        else:
+            if self._cached_lookup((word,)) is None:
+                # unknown word: the following words cannot use it as context
+                logprob, state = self.score_word(word), self.null_state()
+            else:
+                logprob, state = self._prob((word,)), (word,)
+                state = self._next_state(state)
+
+        # add the back-off weights, from the shortest to the longest context
+        for backoff in reversed(backoffs):
+            logprob = backoff + logprob
+
+        return logprob, state
+
     def score_sequence(self, data):
         """
         Compute the log-probability of a given word sequence
@@ -96,22 +245,172 @@ class LanguageModel:
             return self.score_word(data[0])
 
         result = 0
-        history = ()
+        state = self.null_state()
         for word in data:
-            result += self._score(word, history)
-            history += (word,)
+            logprob, state = self.score_state(state, word)
+            result += logprob
         return result
 
+    def score_sequences(self, sequences):
+        """
+        Compute the log-probabilities of several word sequences at once
+
+        The sequences are walked as a prefix tree: the log-probability
+        of a shared prefix (e.g. 'manger une' for both 'manger une pomme'
+        and 'manger une poire') is computed only once, then each branch
+        continues from the accumulated score and state.
+
+        Return a dictionary of {sequence: log-probability}
+        (same values as score_sequence, in the order of the input sequences)
+        """
+
+        sequences = list(sequences)
+        scores = dict.fromkeys(sequences)
+
+        # build the prefix tree, the None key marks the end of sequences
+        tree = {}
+        for seq in scores:
+            node = tree
+            for word in seq.split():
+                node = node.setdefault(word, {})
+            node.setdefault(None, []).append(seq)
+
+        # depth-first walk, accumulating log-probabilities along branches
+        stack = [(tree, self.null_state(), 0)]
+        while stack:
+            node, state, score = stack.pop()
+            for word, child in node.items():
+                if word is None:
+                    for seq in child:
+                        scores[seq] = score
+                else:
+                    logprob, next_state = self.score_state(state, word)
+                    stack.append((child, next_state, score + logprob))
+
+        return scores
+
+    def score_batch(self, sequences):
+        """
+        Compute the log-probabilities of a batch of word sequences
+
+        - collect the distinct (context, word) queries of the batch,
+          the context being truncated to the last (order - 1) words
+        - look up each distinct n-gram and back-off context only once
+        - resolve the back-offs of all the queries with array operations:
+            score = sum(backoff(longer contexts)) + prob(longest match)
+        - sum the query scores of each sequence
+
+        Return a numpy array of log-probabilities
+        (same values as score_sequence, up to floating-point rounding)
+        """
+
+        sequences = list(sequences)
+        width = self.order
+
+        # distinct queries and the query indexes of each sequence
+        queries = {}
+        indexes, positions = [], []
+        for i, seq in enumerate(sequences):
+            words = tuple(seq.split()) if isinstance(seq, str) else tuple(seq)
+            for j, word in enumerate(words):
+                query = (words[max(0, j - width + 1):j], word)
+                indexes.append(queries.setdefault(query, len(queries)))
+                positions.append(i)
+
+        # distinct n-gram lookups
+        lookups = {}
+        def lookup(ngram):
+            if ngram not in lookups:
+                lookups[ngram] = self._cached_lookup(ngram)
+            return lookups[ngram]
+
+        # column c holds the n-grams with a (width - 1 - c)-word context
+        probs = np.full((len(queries), width), np.nan)
+        backoffs = np.zeros((len(queries), width))
+        for q, (context, word) in enumerate(queries):
+            for size in range(len(context), 0, -1):
+                col = width - 1 - size
+                values = lookup(context[-size:] + (word,))
+                if values is not None:
+                    probs[q, col] = values[0]
+                    break
+                values = lookup(context[-size:])
+                if values is not None:
+                    backoffs[q, col] = values[1]
+            else:
+                probs[q, width - 1] = self.score_word(word)
+
+        # longest match, preceded by the back-offs of the longer contexts
+        first = np.argmax(~np.isnan(probs), axis=1)
+        rows = np.arange(len(queries))
+        cumulated = np.cumsum(backoffs, axis=1) - backoffs
+        scores = probs[rows, first] + cumulated[rows, first]
+
+        return np.bincount(
+            np.asarray(positions, dtype=np.int64),
+            weights=scores[np.asarray(indexes, dtype=np.int64)],
+            minlength=len(sequences))
+
     def score_sentence(self, data, bos='<s>', eos='</s>'):
         """Compute the sum of log-probabilities for given sentence"""
         data = bos + ' ' + data + ' ' + eos
         return self.score_sequence(data)
 
-    def order_sequences(self, sequences):
-        """Order the sequences by their n-gram log probabilities"""
-        scores = {seq: self.score_sequence(seq) for seq in sequences}
+    def order_sequences(self, sequences, prefix_tree=True):
+        """
+        Order the sequences by their n-gram log probabilities
+
+        By default, score the sequences as a prefix tree (see score_sequences)
+        instead of rescoring each candidate from scratch
+        """
+        if prefix_tree:
+            scores = self.score_sequences(sequences)
+        else:
+            scores = {seq: self.score_sequence(seq) for seq in sequences}
         return sorted(scores.keys(), key=lambda k: scores[k], reverse=True)
 
+    def decode_lattice(self, lattice, beam_width=10):
+        """
+        Decode a lattice of alternatives with a left-to-right beam search
+
+        The lattice is a list of positions, each holding a list of
+        alternative strings (e.g. the suggestions made for a token).
+        Hypotheses are extended one position at a time and only the
+        'beam_width' best ones are kept, so the cost grows linearly
+        with the number of positions instead of exponentially.
+
+        The extension of a hypothesis only depends on its state
+        (see score_state), therefore the score of an alternative
+        is computed once per such state.
+
+        Return at most 'beam_width' sequences,
+        ordered by their n-gram log probabilities
+        """
+
+        # hypotheses are (score, state, alternatives) tuples
+        beam = [(0, self.null_state(), ())]
+        extensions = {}
+
+        for alternatives in lattice:
+            hypotheses = []
+            for score, state, path in beam:
+                for alternative in alternatives:
+                    if (state, alternative) not in extensions:
+                        logprob, next_state = 0, state
+                        for word in alternative.split():
+                            word_logprob, next_state = self.score_state(
+                                next_state, word)
+                            logprob += word_logprob
+                        extensions[(state, alternative)] = (logprob, next_state)
+
+                    logprob, next_state = extensions[(state, alternative)]
+                    hypotheses.append(
+                        (score + logprob, next_state, path + (alternative,)))
+
+            beam = heapq.nlargest(beam_width, hypotheses, key=lambda h: h[0])
+
+        return [' '.join(path) for _, _, path in beam]
+
     def __getitem__(self, ngram):
         """Allow easy access to n-gram's log probability"""
         return self.score_sequence(ngram)
@@ -0,0 +1,88 @@
+"""Quantize the log-probabilities and back-off weights of n-gram models"""
+
+from bisect import bisect
+import numpy as np
+from ccquery.error import ConfigError
+from ccquery.utils import io_utils
+
+# record formats of the quantized trie-based models, by number of bits
+HEADERS = {8: '<BB', 16: '<HH'}
+DTYPES = {8: np.uint8, 16: np.uint16}
+
+def check_bits(bits):
+    """Check the number of quantization bits"""
+    if bits not in HEADERS:
+        raise ConfigError(
+            "Quantization expects one of {} bits, got {}".format(
+                sorted(HEADERS), bits))
+
+def build_codebook(values, bits):
+    """
+    Define the codebook of given values:
+    split the sorted values into 2^bits bins holding the same number
+    of values, each bin being represented by the mean of its values.
+    Keep the values as they are if there are less values than bins.
+    """
+
+    check_bits(bits)
+
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    unique = np.unique(values)
+    if len(unique) <= 2 ** bits:
+        return unique.astype(np.float32)
+
+    bins = np.array_split(values, 2 ** bits)
+    return np.unique([b.mean() for b in bins]).astype(np.float32)
+
+def boundaries(codebook):
+    """Return the mid-points between consecutive codebook values"""
+    codebook = np.asarray(codebook, dtype=np.float64)
+    return (codebook[1:] + codebook[:-1]) / 2
+
+def encode(values, codebook):
+    """Return the codes (nearest codebook values) of given array of values"""
+    dtype = DTYPES[8] if len(codebook) <= 2 ** 8 else DTYPES[16]
+    return np.searchsorted(
+        boundaries(codebook), values, side='right').astype(dtype)
+
+class Encoder:
+    """Encode single values with the per-order codebooks"""
+
+    def __init__(self, codebooks):
+        """Prepare the codebook boundaries for each (order, field)"""
+        self.boundaries = {
+            key: boundaries(codebook).tolist()
+            for key, codebook in codebooks.items()}
+
+    def __call__(self, order, logprob, backoff):
+        """Return the (logprob, backoff) codes of given n-gram values"""
+        return (
+            bisect(self.boundaries[(order, 'prob')], logprob),
+            bisect(self.boundaries[(order, 'backoff')], backoff))
+
+def codebook_path(model_path):
+    """Return the path of the codebooks associated to a trie-based model"""
+    return io_utils.change_extension(model_path, 'codebook.npz')
+
+def save_codebooks(codebooks, output):
+    """Store the {(order, field): codebook} dictionary into a npz file"""
+    np.savez(output, **{
+        "{}-{}".format(order, field): codebook
+        for (order, field), codebook in codebooks.items()})
+
+def load_codebooks(path):
+    """
+    Load the codebooks stored into a npz file.
+    Return a {order: (prob_values, backoff_values)} dictionary of lists
+    (faster to index than arrays when decoding single values)
+    """
+
+    with np.load(path) as data:
+        codebooks = {}
+        for name in data.files:
+            order, field = name.split('-')
+            codebooks[(int(order), field)] = data[name].tolist()
+
+    return {
+        order: (codebooks[(order, 'prob')], codebooks[(order, 'backoff')])
+        for order, field in codebooks if field == 'prob'}
@@ -1,4 +1,4 @@
-from .vocabulary import Vocabulary
+from .vocabulary import Vocabulary, load_tokens
 from .query_analysis import QueryAnalysis
 from .wiki_extraction import WikiExtraction
 from .voc_mix import VocMix
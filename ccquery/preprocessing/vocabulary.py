@@ -5,6 +5,20 @@ from collections import defaultdict
 from ccquery.error import ConfigError
 from ccquery.utils import io_utils, plot_utils
 
+def load_tokens(path):
+    """
+    Load the tokens stored by the Vocabulary.save_tokens method:
+    return the {token: count} dictionary of a json file,
+    or the tokens of a text file (one per line, counted once)
+    """
+
+    io_utils.check_file_readable(path)
+
+    with open(path, 'r', encoding='utf-8') as istream:
+        if path.endswith('.json'):
+            return json.load(istream)
+        return {line.strip(): 1 for line in istream if line.strip()}
+
 class Vocabulary:
     """
     Analyze the use of tokens (characters or words) within a data set
@@ -1 +1,2 @@
+from .gazetteer import Gazetteer
 from .spacy_loader import SpacyLoader
@@ -0,0 +1,106 @@
+import logging
+from marisa_trie import Trie
+from ccquery.error import ConfigError
+from ccquery.preprocessing import load_tokens
+from ccquery.utils import io_utils
+
+class Gazetteer:
+    """
+    Detect named entities from a list of surface forms
+
+    Focus:
+    - store the lowercased and tokenized surface forms (single or
+      multi-word) into a marisa trie (tokens joined by spaces)
+    - scan the tokens of a text from left to right, matching the longest
+      surface form starting at each token
+    - flag the tokens of the matched spans
+    """
+
+    def __init__(self, path=None, entities=None, tokenizer=None):
+        """
+        Load the surface forms either
+        - from path (text file with one surface form per line, json
+          dictionary of surface forms, or marisa trie saved by the
+          save method)
+        - or from a list of surface forms
+        Tokenize the surface forms with given tokenizer (callable returning
+        the tokens of a text), by white spaces by default
+        """
+
+        self.logger = logging.getLogger(__name__)
+
+        if path and isinstance(path, str) \
+                and io_utils.has_extension(path, '.marisa'):
+            io_utils.check_file_readable(path)
+            self.trie = Trie()
+            self.trie.mmap(path)
+        else:
+            if path and isinstance(path, str):
+                entities = load_tokens(path)
+            elif not entities:
+                raise ConfigError('Method expects a file path or a list')
+
+            if tokenizer is None:
+                tokenizer = str.split
+
+            keys = set()
+            for entity in entities:
+                tokens = [
+                    token.lower() for token in tokenizer(entity)
+                    if token.strip()]
+                if tokens:
+                    keys.add(' '.join(tokens))
+            self.trie = Trie(keys)
+
+        self.max_tokens = max(
+            (key.count(' ') + 1 for key in self.trie.iterkeys()), default=0)
+
+        self.logger.info("Loaded {:,} entities (at most {} tokens)".format(
+            len(self.trie), self.max_tokens))
+
+    def __len__(self):
+        return len(self.trie)
+
+    def __contains__(self, entity):
+        return entity in self.trie
+
+    def save(self, path):
+        """Save the trie of surface forms (memory-mapped when loaded)"""
+
+        io_utils.create_path(path)
+        self.trie.save(path)
+
+    def match(self, tokens):
+        """
+        Return the (start, end) token spans of the entities found
+        in given list of lowercased tokens (longest match first)
+        """
+
+        spans = []
+        start = 0
+        while start < len(tokens):
+            text = ' '.join(tokens[start:start + self.max_tokens])
+
+            # longest surface form ending on a token boundary
+            length = 0
+            for prefix in self.trie.prefixes(text):
+                if len(prefix) > length \
+                        and (len(prefix) == len(text)
+                             or text[len(prefix)] == ' '):
+                    length = len(prefix)
+
+            if length:
+                end = start + text[:length].count(' ') + 1
+                spans.append((start, end))
+                start = end
+            else:
+                start += 1
+        return spans
+
+    def flag(self, tokens):
+        """Return the flags of the tokens belonging to an entity"""
+
+        flags = [0] * len(tokens)
+        for start, end in self.match(tokens):
+            flags[start:end] = [1] * (end - start)
+        return flags
@@ -1,12 +1,36 @@
 import logging
+from functools import partial
+from multiprocessing import get_context
 import spacy
-from ccquery.error import ConfigError
+from ccquery.error import ConfigError, CaughtException
+from ccquery.spacy.gazetteer import Gazetteer
+
+def _split_and_flag_chunks(loader, chunks, connection):
+    """
+    Tokenize and flag chunks of texts within a forked process
+    (the loader is inherited from the parent process),
+    send back the (tokens, flags) of each chunk
+    """
+    connection.send([
+        [loader.flag_doc(doc)
+         for doc in loader.pipe(chunk, batch_size=len(chunk))]
+        for chunk in chunks])
+    connection.close()
 
 class SpacyLoader:
-    """Load and use spacy NLP models"""
+    """
+    Load and use spacy NLP models
 
-    def __init__(self, model, disable=None):
-        """Load spacy model and disable pipes if requested"""
+    In tokenizer-only mode, the texts only go through the tokenizer
+    (no tagger, parser or NER): the tokens are flagged from their lexical
+    attributes, and optionally from a gazetteer of named entities
+    """
+
+    def __init__(self, model, disable=None, tokenizer_only=False):
+        """
+        Load spacy model and disable pipes if requested
+        (ignore the whole pipeline in tokenizer-only mode)
+        """
 
         self.logger = logging.getLogger(__name__)
 
@@ -15,34 +39,129 @@ class SpacyLoader:
         except OSError as exc:
             raise ConfigError("Model {} not found: {}".format(model, exc))
 
-        self.pipeline = [x[0] for x in self.nlp.pipeline]
+        self.tokenizer_only = tokenizer_only
+        self.pipeline = [] if tokenizer_only \
+            else [x[0] for x in self.nlp.pipeline]
+
+        self.gazetteer = None
+
+    def set_gazetteer(self, gazetteer=None):
+        """
+        Flag the named entities found by given gazetteer
+        (any object with a flag(tokens) method returning a flag per token)
+        """
+        self.gazetteer = gazetteer
+
+    def load_gazetteer(self, path):
+        """
+        Load a gazetteer of named entities from path (see Gazetteer),
+        the surface forms being split by the spacy tokenizer
+        """
+
+        self.set_gazetteer(Gazetteer(
+            path, tokenizer=partial(self.str_tokenize, tokenize_only=True)))
 
     def check_pipe(self, pipe):
         """Check if given component is present in the pipeline"""
         return pipe in self.pipeline
 
-    def tokenize(self, text):
+    def make_doc(self, text, tokenize_only=None):
+        """
+        Analyze given text with the whole pipeline,
+        or with the tokenizer only (default in tokenizer-only mode)
+        """
+
+        if tokenize_only is None:
+            tokenize_only = self.tokenizer_only
+
+        if tokenize_only:
+            return self.nlp.make_doc(text)
+        return self.nlp(text)
+
+    def pipe(self, texts, batch_size=1000):
+        """Analyze given texts in batches (see make_doc)"""
+
+        if self.tokenizer_only:
+            return self.nlp.tokenizer.pipe(texts, batch_size=batch_size)
+        return self.nlp.pipe(texts, batch_size=batch_size)
+
+    def tokenize(self, text, tokenize_only=None):
         """Tokenize given text and yield each token"""
-        doc = self.nlp(text)
+        doc = self.make_doc(text, tokenize_only=tokenize_only)
         for token in doc:
             yield token
 
-    def str_tokenize(self, text):
+    def str_tokenize(self, text, tokenize_only=None):
         """Tokenize given text and yield each token's content"""
-        doc = self.nlp(text)
+        doc = self.make_doc(text, tokenize_only=tokenize_only)
         for token in doc:
             yield token.text
 
-    def split_and_flag(self, text):
+    def split_and_flag(self, text, tokenize_only=None):
         """
         Tokenize given text.
 
         Flag to ignore tokens
           - shaped like punctuation, numbers, urls or emails
           - representing named entities
+
+        If requested, only run the tokenizer
+        (default in tokenizer-only mode, see make_doc)
+        """
+        return self.flag_doc(self.make_doc(text, tokenize_only=tokenize_only))
+
+    def split_and_flag_batch(self, texts, batch_size=1000, n_process=1):
         """
+        Tokenize and flag the given texts (see split_and_flag)
+        through the batched spacy pipeline.
+        Split the work between 'n_process' forked processes, if requested.
+        Return the list of (tokens, flags) of each text.
+        """
+
+        texts = list(texts)
+
+        if n_process <= 1 or len(texts) <= batch_size:
+            return [
+                self.flag_doc(doc)
+                for doc in self.pipe(texts, batch_size=batch_size)]
+
+        chunks = [
+            texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
 
-        doc = self.nlp(text)
+        # the forked workers share the memory pages of the loaded model,
+        # only their results are sent back (round-robin chunks)
+        n_process = min(n_process, len(chunks))
+        context = get_context('fork')
+        workers = []
+        for i in range(n_process):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=partial(
+                _split_and_flag_chunks, self, chunks[i::n_process], sender))
+            process.start()
+            sender.close()
+            workers.append((process, receiver))
+
+        try:
+            parts = [receiver.recv() for _, receiver in workers]
+        except EOFError:
+            for process, _ in workers:
+                process.terminate()
+            raise CaughtException('A tokenizer process failed')
+        finally:
+            for process, receiver in workers:
+                receiver.close()
+                process.join()
+
+        results = []
+        for i in range(len(chunks)):
+            results.extend(parts[i % n_process][i // n_process])
+        return results
+
+    def flag_doc(self, doc):
+        """
+        Return the (tokens, flags) of an analyzed text
+        (named entities detected by the NER pipe or by the gazetteer)
+        """
 
         tokens, flags = [], []
         for token in doc:
@@ -57,4 +176,10 @@ class SpacyLoader:
                     flags.append(1)
                 else:
                     flags.append(0)
+
+        if self.gazetteer is not None:
+            flags = [
+                max(flag, entity)
+                for flag, entity in zip(flags, self.gazetteer.flag(tokens))]
+
         return tokens, flags
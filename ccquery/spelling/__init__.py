@@ -1,3 +1,5 @@
 from .eval import Evaluation
 from .hunspelling import HunSpelling
+from .symspelling import SymSpelling
+from .triespelling import TrieSpelling
 from .b1correction import B1Correction
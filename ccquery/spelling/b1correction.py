@@ -1,8 +1,34 @@
+import json
+import time
 import logging
+import threading
+from collections import Counter
+from itertools import product
+from ccquery.error import ConfigError
 from ccquery.spacy import SpacyLoader
-from ccquery.spelling import HunSpelling
+from ccquery.spelling import HunSpelling, SymSpelling, TrieSpelling
 from ccquery.ngram import LanguageModel
 from ccquery.utils import str_utils
+from ccquery.utils.metric_utils import \
+    Histogram, StageTimer, Exposition, COUNT_BUCKETS
+
+# stages of the correction of a query, timed by correct_with_details
+STAGES = ('tokenize', 'detect', 'suggest', 'expand', 'score', 'postprocess')
+
+# degradation levels of the corrections exceeding their time budget
+DEGRADATIONS = (
+    'full',               # every suggestion, scored by the n-gram LM
+    'fewer_suggestions',  # at most 'degraded_suggestions' per token
+    'small_beam',         # beam search of width 'degraded_beam_width'
+    'no_rerank',          # first suggestion of each token, no n-gram LM
+    'unchanged',          # original query returned as it is
+)
+
+# candidate generators available next to hunspell's suggestions
+SUGGESTERS = {
+    'symspell': SymSpelling,
+    'automaton': TrieSpelling,
+}
 
 class B1Correction:
     """
@@ -10,9 +36,16 @@ class B1Correction:
 
     Baseline 1
     - use spacy for tokenization and named-entity detection
+      (optionally, use the spacy tokenizer only,
+      and detect the named entities with a gazetteer)
     - use hunspell for detecting isolated non-word spelling errors
       and suggesting candidate corrections
+      (optionally, suggest them with another candidate generator)
     - rerank candidates using a n-gram language model
+      (optionally, decode them with a beam search)
+    - return the tokenized query as it is, after the tokenizer only,
+      when none of its tokens is misspelled (fast path)
+    - optionally, degrade the correction to fit a time budget
     """
 
     def __init__(self):
@@ -21,41 +54,546 @@ class B1Correction:
         self.nlp = None
         self.hunspell = None
         self.ngram = None
+        self.beam_width = None
+        self.fast_path = True
+
+        # degradations of the corrections exceeding their time budget,
+        # with the estimated duration per expanded and scored candidate
+        self.degraded_suggestions = 3
+        self.degraded_beam_width = 2
+        self.candidate_cost = 2e-5
+
+        self.counters = Counter()
+        self.degradations = Counter()
+        self.lock = threading.Lock()
+
+        self.histograms = {stage: Histogram() for stage in STAGES + ('total',)}
+        self.candidate_counts = Histogram(COUNT_BUCKETS)
+
+        # stage durations of the whole batches of correct_batch
+        self.batch_histograms = {
+            stage: Histogram() for stage in STAGES + ('total',)}
+
+        # durations of the model loads (in seconds)
+        self.load_times = {}
 
         self.logger = logging.getLogger(__name__)
 
-    def load_spacy(self, nlp_model, disable=None):
-        """Load the spacy NLP pipelines"""
+    def load_spacy(
+            self, nlp_model, disable=None, tokenizer_only=False,
+            gazetteer=None):
+        """
+        Load the spacy NLP pipelines
+        (or only the tokenizer, in tokenizer-only mode)
+        and the gazetteer of named entities, if requested
+        """
 
-        self.nlp = SpacyLoader(nlp_model, disable=disable)
+        tstart = time.perf_counter()
+        self.nlp = SpacyLoader(
+            nlp_model, disable=disable, tokenizer_only=tokenizer_only)
+        if gazetteer:
+            self.nlp.load_gazetteer(gazetteer)
+        self.load_times['spacy'] = time.perf_counter() - tstart
         self.logger.info('Loaded spacy NLP model')
 
-    def load_hunspell(self, dic_file, aff_file, extra_dic=None):
-        """Load the hunspell analysis"""
+    def load_hunspell(
+            self, dic_file, aff_file, extra_dic=None,
+            cache_size=None, cache_file=None):
+        """
+        Load the hunspell analysis
+        (optionally, cache the suggestions in memory and on disk)
+        """
 
-        self.hunspell = HunSpelling(dic_file, aff_file, extra_dic=extra_dic)
+        tstart = time.perf_counter()
+        self.hunspell = HunSpelling(
+            dic_file, aff_file, extra_dic=extra_dic,
+            cache_size=cache_size, cache_file=cache_file)
+        self.load_times['hunspell'] = time.perf_counter() - tstart
         self.logger.info('Loaded hunspell checker')
 
-    def load_ngram(self, ngram_model, **kwargs):
-        """Load the n-gram language model"""
+    def load_suggester(self, name, **kwargs):
+        """
+        Load the candidate generator suggesting the corrections
+        of the misspelled words ('hunspell' or one of SUGGESTERS).
+        The 'automaton' generator can draw its vocabulary from the unigrams
+        of the loaded n-gram language model (use_ngram=True)
+        """
+
+        if self.hunspell is None:
+            raise ConfigError('Load the hunspell checker before the suggester')
+
+        # identify the stored suggestions by the generator and its parameters
+        params = dict(kwargs)
 
+        if kwargs.pop('use_ngram', False):
+            if self.ngram is None:
+                raise ConfigError(
+                    'Load the n-gram language model before the suggester')
+            kwargs['language_model'] = self.ngram
+            params['use_ngram'] = self.ngram.path
+
+        backend = json.dumps([name, params], sort_keys=True, default=str)
+
+        tstart = time.perf_counter()
+        if name == 'hunspell':
+            self.hunspell.set_suggester(None, backend='hunspell')
+        elif name in SUGGESTERS:
+            self.hunspell.set_suggester(
+                SUGGESTERS[name](**kwargs), backend=backend)
+        else:
+            raise ConfigError(
+                "Unknown suggester '{}', expected one of {}".format(
+                    name, ['hunspell'] + sorted(SUGGESTERS)))
+        self.load_times['suggester'] = time.perf_counter() - tstart
+
+        self.logger.info("Loaded {} suggester".format(name))
+
+    def load_ngram(self, ngram_model, beam_width=None, **kwargs):
+        """
+        Load the n-gram language model.
+        If a beam width is given, decode the suggestions with a beam search
+        instead of scoring every combination of suggestions
+        (at most 'beam_width' candidates are then returned)
+        """
+
+        tstart = time.perf_counter()
         self.ngram = LanguageModel(ngram_model, **kwargs)
+        self.load_times['ngram'] = time.perf_counter() - tstart
+        self.beam_width = beam_width
         self.logger.info('Loaded n-gram language model')
 
-    def correct(self, query, topn=5):
-        """Return top candidate corrections for given query"""
+    def load_config(self, config):
+        """
+        Load every model from a configuration dictionary
+        (spacy, hunspell, ngram and optional suggester sections,
+        as in the API configuration)
+        """
+
+        self.load_spacy(
+            config['spacy']['model'],
+            config['spacy'].get('disable'),
+            config['spacy'].get('tokenizer_only', False),
+            config['spacy'].get('gazetteer'))
+        self.load_hunspell(
+            config['hunspell']['dic'],
+            config['hunspell']['aff'],
+            config['hunspell'].get('extra'),
+            cache_size=config['hunspell'].get('cache_size'),
+            cache_file=config['hunspell'].get('cache_file'))
+        self.load_ngram(
+            config['ngram']['model'],
+            beam_width=config['ngram'].get('beam_width'),
+            **config['ngram'].get('kwargs', {}))
+        if 'suggester' in config:
+            self.load_suggester(
+                config['suggester']['name'],
+                **config['suggester'].get('kwargs', {}))
+
+    def _count(self, queries, fast_path=0):
+        """Update the counters of corrected queries"""
+        with self.lock:
+            self.counters['queries'] += queries
+            self.counters['fast_path'] += fast_path
+
+    def stats(self):
+        """
+        Return the number of corrected queries,
+        the number and ratio of queries taking the fast path,
+        the summaries of the stage durations (in seconds)
+        and of the number of candidates of the queries
+        corrected by correct_with_details,
+        and their number by degradation level (see DEGRADATIONS),
+        the summaries of the stage durations of the batches
+        corrected by correct_batch
+        """
+
+        with self.lock:
+            queries = self.counters['queries']
+            fast_path = self.counters['fast_path']
+            degradations = [
+                (level, self.degradations[level]) for level in DEGRADATIONS]
+
+        ratio = round(fast_path / queries, 4) if queries else 0.0
+
+        return {
+            'queries': queries,
+            'fast_path': fast_path,
+            'fast_path_ratio': ratio,
+            'timings': {
+                stage: histogram.summary()
+                for stage, histogram in self.histograms.items()},
+            'candidates': self.candidate_counts.summary(),
+            'degradation': dict(degradations),
+            'batch_timings': {
+                stage: histogram.summary()
+                for stage, histogram in self.batch_histograms.items()},
+        }
+
+    def metrics(self, exposition=None, caches=None):
+        """
+        Add the correction metrics to given exposition (see stats),
+        with the usage of the hunspell caches and of the given
+        (labels, stats) caches, and the model load durations
+        """
+
+        if exposition is None:
+            exposition = Exposition()
+
+        with self.lock:
+            queries = self.counters['queries']
+            fast_path = self.counters['fast_path']
+            degradations = [
+                (level, self.degradations[level]) for level in DEGRADATIONS]
+
+        exposition.counter(
+            'corrected_queries', 'Number of corrected queries', queries)
+        exposition.counter(
+            'fast_path_queries',
+            'Number of queries without misspelled tokens', fast_path)
+        exposition.histogram(
+            'stage_duration_seconds',
+            'Duration of the correction stages',
+            [({'stage': stage}, histogram)
+             for stage, histogram in self.histograms.items()])
+        exposition.histogram(
+            'batch_stage_duration_seconds',
+            'Duration of the correction stages of the batches',
+            [({'stage': stage}, histogram)
+             for stage, histogram in self.batch_histograms.items()])
+        exposition.histogram(
+            'candidates', 'Number of candidates per corrected query',
+            self.candidate_counts)
+        exposition.counter(
+            'degraded_queries',
+            'Number of queries corrected by correct_with_details, '
+            'by degradation level',
+            [({'level': level}, count) for level, count in degradations])
+
+        caches = list(caches or [])
+        if self.hunspell is not None:
+            caches.extend(
+                ({'cache': 'hunspell_' + name}, stats)
+                for name, stats in self.hunspell.cache_info().items()
+                if stats is not None)
+        if caches:
+            exposition.caches(caches)
+
+        exposition.gauge(
+            'model_load_seconds', 'Duration of the model loads',
+            [({'model': model}, round(duration, 6))
+             for model, duration in self.load_times.items()])
+
+        return exposition
+
+    def clear_stats(self):
+        """Reset the counters and the histograms"""
+
+        with self.lock:
+            self.counters.clear()
+            self.degradations.clear()
+        for histogram in self.histograms.values():
+            histogram.clear()
+        for histogram in self.batch_histograms.values():
+            histogram.clear()
+        self.candidate_counts.clear()
+
+    def precompute_suggestions(self, queries):
+        """
+        Store the suggestions of the misspelled words of given queries
+        (see HunSpelling.precompute_suggestions), the words being
+        tokenized and flagged as by the corrections.
+        Return the number of new entries.
+        """
+
+        words = set()
+        for query in queries:
+            tokens, flags = self.nlp.split_and_flag(query, tokenize_only=True)
+            misspelled = self.hunspell.detect(tokens, ignore=flags)
+            words.update(
+                token for token, flag in zip(tokens, misspelled) if flag)
+        return self.hunspell.precompute_suggestions(words)
+
+    def _fast_path(self, query, timer=None):
+        """
+        Check the spelling of given query after the tokenizer only.
+        Return the post-processed tokens of the query if none of them
+        is misspelled (None otherwise), along with its tokens, their
+        named-entity flags and their misspelling flags.
+        Ignoring the named entities can only remove tokens to check,
+        hence the result of the full pipeline would be the same.
+        """
+
+        if timer is None:
+            timer = StageTimer()
+
+        with timer.stage('tokenize'):
+            tokens, flags = self.nlp.split_and_flag(query, tokenize_only=True)
+        with timer.stage('detect'):
+            misspelled = self.hunspell.detect(tokens, ignore=flags)
+
+        if any(misspelled):
+            return None, (tokens, flags, misspelled)
+
+        with timer.stage('postprocess'):
+            candidates = [
+                str_utils.remove_spaces_apostrophes(' '.join(tokens))]
+        return candidates, (tokens, flags, misspelled)
+
+    def correct(self, query, topn=5, budget=None):
+        """
+        Return top candidate corrections for given query
+        (within a time budget, in seconds, if requested)
+        """
+        return self.correct_with_details(query, topn=topn, budget=budget)[0]
+
+    def _estimate(self, lattice, beam_width):
+        """Estimate the duration of the expansion and scoring of a lattice"""
+
+        if beam_width:
+            count = beam_width * sum(len(words) for words in lattice)
+        else:
+            count = 1
+            for words in lattice:
+                count *= len(words)
+        return count * self.candidate_cost
+
+    def _learn_cost(self, duration, count):
+        """
+        Update the average duration per candidate (moving average)
+        from the duration of the expansion and scoring of 'count'
+        candidates (as counted by _estimate)
+        """
+
+        cost = duration / max(1, count)
+        with self.lock:
+            self.candidate_cost += 0.1 * (cost - self.candidate_cost)
+
+    def _degrade(self, lattice, remaining):
+        """
+        Return the first degradation level (see DEGRADATIONS)
+        whose estimated duration fits the remaining time,
+        with its lattice and its beam width
+        """
+
+        if remaining <= 0:
+            return 'unchanged', lattice, None
+
+        beam_width = self.beam_width
+        if self._estimate(lattice, beam_width) <= remaining:
+            return 'full', lattice, beam_width
+
+        lattice = [words[:self.degraded_suggestions] for words in lattice]
+        if self._estimate(lattice, beam_width) <= remaining:
+            return 'fewer_suggestions', lattice, beam_width
+
+        beam_width = min(
+            beam_width or self.degraded_beam_width, self.degraded_beam_width)
+        if self._estimate(lattice, beam_width) <= remaining:
+            return 'small_beam', lattice, beam_width
+
+        return 'no_rerank', lattice, None
+
+    def correct_with_details(self, query, topn=5, budget=None):
+        """
+        Return top candidate corrections for given query,
+        and the details of the correction:
+        - 'fast_path': whether the query took the fast path
+        - 'degradation': the degradation level used to fit the time budget
+        - 'candidates': the number of generated candidates
+        - 'timings': the duration of each stage (in seconds),
+          the beam search both expanding and scoring the candidates
+
+        Given a time budget (in seconds), progressively degrade the
+        correction when its estimated duration would exceed the budget
+        (see DEGRADATIONS). The deadline is checked before each stage,
+        and before the suggestions of each token.
+        """
+
+        timer = StageTimer()
+        deadline = time.perf_counter() + budget if budget else None
+        tokens = misspelled = None
+
+        def expired():
+            return deadline is not None and time.perf_counter() >= deadline
+
+        if self.fast_path:
+            candidates, (tokens, flags, misspelled) = self._fast_path(
+                query, timer)
+            if candidates is not None:
+                return candidates[:topn], self._report(
+                    timer, candidates, fast_path=True)
+
+        # recover tokens and flags for tokens to ignore by spellchecker
+        # (already known in tokenizer-only mode)
+        if tokens is None or not self.nlp.tokenizer_only:
+            tokens = misspelled = None
+            if not expired():
+                with timer.stage('tokenize'):
+                    tokens, flags = self.nlp.split_and_flag(query)
+
+            # detect the misspelled tokens
+            if tokens is not None and not expired():
+                with timer.stage('detect'):
+                    misspelled = self.hunspell.detect(tokens, ignore=flags)
+
+        # recover the hunspell suggestions, token by token
+        # (none once the deadline is exceeded)
+        lattice = None
+        if misspelled is not None and not expired():
+            with timer.stage('suggest'):
+                lattice = []
+                for token, flag in zip(tokens, misspelled):
+                    if expired():
+                        lattice = None
+                        break
+                    lattice.extend(self.hunspell.suggest([token], [flag]))
+
+        level = 'full'
+        beam_width = self.beam_width
+
+        if lattice is None:
+            # no time left for the suggestions
+            level = 'unchanged'
+        elif deadline is not None:
+            level, lattice, beam_width = self._degrade(
+                lattice, deadline - time.perf_counter())
+
+        if level == 'unchanged':
+            return [query], self._report(timer, [query], degradation=level)
+
+        if level == 'no_rerank':
+            # keep the first suggestion of each token
+            candidates = [' '.join(words[0] for words in lattice)]
+        elif beam_width:
+            # combine the hunspell suggestions with the n-gram language model
+            with timer.stage('score'):
+                candidates = self.ngram.decode_lattice(lattice, beam_width)
+
+            self._learn_cost(
+                timer.timings['score'],
+                beam_width * sum(len(words) for words in lattice))
+        else:
+            # combine the suggestions of each token
+            with timer.stage('expand'):
+                candidates = [' '.join(sol) for sol in product(*lattice)]
+
+            # re-order the candidates list by the n-gram language model
+            with timer.stage('score'):
+                candidates = self.ngram.order_sequences(candidates)
+
+            self._learn_cost(
+                timer.timings['expand'] + timer.timings['score'],
+                len(candidates))
+
+        # post-process sequences (remove spaces surrounding punctuation marks)
+        with timer.stage('postprocess'):
+            candidates = [
+                str_utils.remove_spaces_apostrophes(s) for s in candidates]
+
+        return candidates[:topn], self._report(
+            timer, candidates, degradation=level)
+
+    def _report(self, timer, candidates, fast_path=False, degradation='full'):
+        """Aggregate the measures of a corrected query, return its details"""
+
+        self._count(1, fast_path=int(fast_path))
+        with self.lock:
+            self.degradations[degradation] += 1
+
+        for stage, duration in timer.timings.items():
+            self.histograms[stage].observe(duration)
+        self.histograms['total'].observe(timer.total())
+        self.candidate_counts.observe(len(candidates))
+
+        timings = {
+            stage: round(duration, 6)
+            for stage, duration in timer.timings.items()}
+        timings['total'] = round(timer.total(), 6)
+
+        return {
+            'fast_path': fast_path,
+            'degradation': degradation,
+            'candidates': len(candidates),
+            'timings': timings,
+        }
+
+    def correct_batch(self, queries, topn=5, batch_size=1000, n_process=1):
+        """
+        Return the top candidate corrections of each given query
+        (same results as the correct method, in the order of the queries)
+
+        - return the queries without misspelled tokens as they are (fast path)
+        - tokenize the other distinct queries through the batched spacy
+          pipeline (split between 'n_process' processes, if requested)
+        - compute the hunspell suggestions of each distinct token only once
+        - score the distinct candidates of all the queries as a single batch
+          (vectorized back-off computation, see LanguageModel.score_batch)
+
+        The stage durations of the whole batch are measured (see stats),
+        the corrections are never degraded (no time budget)
+        """
+
+        timer = StageTimer()
+        queries = list(queries)
+        distinct = list(dict.fromkeys(queries))
+
+        corrections = {}
+        if self.fast_path:
+            for query in distinct:
+                candidates, _ = self._fast_path(query, timer)
+                if candidates is not None:
+                    corrections[query] = candidates
+            distinct = [q for q in distinct if q not in corrections]
+
+        self._count(
+            len(queries),
+            fast_path=sum(query in corrections for query in queries))
 
         # recover tokens and flags for tokens to ignore by spellchecker
-        tokens, flags = self.nlp.split_and_flag(query)
+        with timer.stage('tokenize'):
+            analyses = self.nlp.split_and_flag_batch(
+                distinct, batch_size=batch_size, n_process=n_process)
 
-        # recover the list of correction suggestions made by hunspell
-        candidates = self.hunspell.correct(tokens, ignore=flags)
+        # detect the misspelled tokens, recover their suggestions
+        with timer.stage('suggest'):
+            lattices = self.hunspell.suggestion_lattices(
+                [tokens for tokens, _ in analyses],
+                ignores=[flags for _, flags in analyses])
 
-        # re-order the candidates list by the n-gram language model
-        candidates = self.ngram.order_sequences(candidates)
+        if self.beam_width:
+            with timer.stage('score'):
+                candidates = [
+                    self.ngram.decode_lattice(lattice, self.beam_width)
+                    for lattice in lattices]
+        else:
+            with timer.stage('expand'):
+                candidates = [
+                    list(dict.fromkeys(
+                        ' '.join(sol) for sol in product(*lattice)))
+                    for lattice in lattices]
+
+            # re-order the candidates lists by the n-gram language model,
+            # scoring the distinct candidates of the batch at once
+            with timer.stage('score'):
+                distinct_sequences = list(dict.fromkeys(
+                    sequence for sequences in candidates
+                    for sequence in sequences))
+                scores = dict(zip(
+                    distinct_sequences,
+                    self.ngram.score_batch(distinct_sequences).tolist()))
+                candidates = [
+                    sorted(sequences, key=lambda k: scores[k], reverse=True)
+                    for sequences in candidates]
 
         # post-process sequences (remove spaces surrounding punctuation marks)
-        candidates = [
-            str_utils.remove_spaces_apostrophes(s) for s in candidates]
+        with timer.stage('postprocess'):
+            corrections.update({
+                query: [
+                    str_utils.remove_spaces_apostrophes(s) for s in sequences]
+                for query, sequences in zip(distinct, candidates)})
+
+        for stage, duration in timer.timings.items():
+            self.batch_histograms[stage].observe(duration)
+        self.batch_histograms['total'].observe(timer.total())
 
-        return candidates[:topn]
+        return [corrections[query][:topn] for query in queries]
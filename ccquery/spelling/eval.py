@@ -27,6 +27,12 @@ class Evaluation:
         P@N = 1 / |Q| * sum( |C(q) ∩ G(q)| / min(N, |C(q)|) )
     - F1@N = (2 * P@N * R@N) / (P@N + R@N)
 
+    Compare the suggestions with the ones of a reference system
+    (e.g. the ranking-quality delta of a quantized language model)
+    - the percentage of queries with the same top-1 suggestion
+    - the percentage of queries with the same top-N suggestions
+    - the average overlap of the top-N suggestions
+
     Use case
     -----------
     Consider
@@ -103,3 +109,47 @@ class Evaluation:
         f1_n = round((2 * recall_n * precision_n) / (recall_n + precision_n), 2)
 
         return recall_n, precision_n, f1_n
+
+    def ranking_agreement(self, reference, n=5):
+        """
+        Compare the current suggestions with the reference suggestions
+        made for the same queries (e.g. by a quantized language model
+        and by the original one).
+
+        Return the percentage of queries with
+        - the same top-1 suggestion
+        - the same top-N suggestions, in the same order
+        and the average overlap of their top-N suggestions
+        """
+
+        same_top1 = 0
+        same_topn = 0
+        overlap_n = 0
+
+        n_queries = 0
+        for (suggestions, _), ref_suggestions in zip(self.data, reference):
+            n_queries += 1
+
+            if not isinstance(suggestions, list):
+                suggestions = [suggestions]
+            if not isinstance(ref_suggestions, list):
+                ref_suggestions = [ref_suggestions]
+
+            suggestions = suggestions[:n]
+            ref_suggestions = ref_suggestions[:n]
+
+            if suggestions[:1] == ref_suggestions[:1]:
+                same_top1 += 1
+            if suggestions == ref_suggestions:
+                same_topn += 1
+
+            n_common = len(set(suggestions) & set(ref_suggestions))
+            overlap_n += n_common / max(len(ref_suggestions), 1)
+
+        if n_queries == 0:
+            raise DataError('No corrections available for evaluation')
+
+        return (
+            round(same_top1 / n_queries * 100, 2),
+            round(same_topn / n_queries * 100, 2),
+            round(overlap_n / n_queries * 100, 2))
@@ -1,26 +1,93 @@
+import hashlib
 from itertools import product
 from hunspell import HunSpell
 from ccquery.utils import io_utils
+from ccquery.utils.cache_utils import LRUCache, PersistentCache
 
 class HunSpelling:
     """
     Use the hunspell tool to detect isolated non-word spelling errors
-    and to suggest candidate corrections
+    and to suggest candidate corrections.
+    The suggestions can be delegated to another candidate generator
+    (any object with a get_suggestions(word) method).
+    The suggestions can be cached in memory (bounded LRU cache)
+    and into a persistent store shared across processes and restarts.
+    The stored suggestions are keyed by a fingerprint of the dictionary
+    (files and added or removed words) and by the candidate generator:
+    the suggestions computed with other dictionaries or generators
+    are kept, but never returned.
     """
 
-    def __init__(self, dic_file, aff_file, extra_dic=None):
+    def __init__(
+            self, dic_file, aff_file, extra_dic=None,
+            cache_size=None, cache_file=None):
         """
         Load the dictionary and affix files for spell checking.
         Allow adding an extra dictionary.
+        Keep the suggestions of the 'cache_size' most recent words in memory,
+        and every computed suggestion into the 'cache_file' store,
+        if requested.
         """
 
         io_utils.check_file_readable(dic_file)
         io_utils.check_file_readable(aff_file)
 
         self.hunspell = HunSpell(dic_file, aff_file)
+        self.backend = 'hunspell'
+        self.fingerprint = ''
+        self.namespace = ''
+        self._update_fingerprint(
+            'dic', io_utils.checksum(dic_file), io_utils.checksum(aff_file))
+
         if extra_dic:
             io_utils.check_file_readable(extra_dic)
             self.hunspell.add_dic(extra_dic)
+            self._update_fingerprint('extra', io_utils.checksum(extra_dic))
+
+        self.suggester = None
+        self.cache = LRUCache(cache_size) if cache_size else None
+        self.store = PersistentCache(cache_file) if cache_file else None
+
+    def set_suggester(self, suggester=None, backend=None):
+        """
+        Delegate the correction suggestions to given candidate generator
+        (back to hunspell's suggestions if None).
+        The backend string identifies the generator and its parameters
+        within the persistent store (class name by default).
+        """
+
+        self.suggester = suggester
+        if backend is None:
+            backend = type(suggester).__name__ if suggester else 'hunspell'
+        self.backend = backend
+        self._update_namespace()
+        self._clear_memory()
+
+    def _update_fingerprint(self, *parts):
+        """
+        Derive the fingerprint of the dictionary from the previous one
+        and given change (file checksums, added or removed word)
+        """
+
+        digest = hashlib.sha1(self.fingerprint.encode('utf-8'))
+        for part in parts:
+            digest.update(b'\0' + part.encode('utf-8'))
+        self.fingerprint = digest.hexdigest()[:16]
+        self._update_namespace()
+
+    def _update_namespace(self):
+        """
+        Define the prefix of the stored suggestions
+        from the fingerprint of the dictionary and from the backend
+        """
+
+        digest = hashlib.sha1(
+            (self.fingerprint + '\0' + self.backend).encode('utf-8'))
+        self.namespace = digest.hexdigest()[:16]
+
+    def _store_key(self, word):
+        """Return the key of given word within the persistent store"""
+        return self.namespace + ':' + word
 
     def is_misspelled(self, word):
         """Check if given word is misspelled"""
@@ -30,6 +97,8 @@ class HunSpelling:
         """Add new word into hunspell's dictionary"""
         if word:
             self.hunspell.add(word)
+            self._update_fingerprint('add', word)
+            self._clear_memory()
 
     def add_words(self, words):
         """Add new words into hunspell's dictionary"""
@@ -42,10 +111,14 @@ class HunSpelling:
         """Add an extra dictionary to the current instance"""
         io_utils.check_file_readable(dic_file)
         self.hunspell.add_dic(dic_file)
+        self._update_fingerprint('extra', io_utils.checksum(dic_file))
+        self._clear_memory()
 
     def remove_word(self, word):
         """Remove word from hunspell's dictionary"""
         self.hunspell.remove(word)
+        self._update_fingerprint('remove', word)
+        self._clear_memory()
 
     def remove_words(self, words):
         """Remove words from hunspell's dictionary"""
@@ -55,7 +128,32 @@ class HunSpelling:
             self.remove_word(word)
 
     def get_suggestions(self, word):
-        """Return correction suggestions"""
+        """Return correction suggestions (from the caches, if available)"""
+
+        if self.cache is not None:
+            suggestions = self.cache.get(word)
+            if suggestions is not None:
+                return suggestions
+
+        suggestions = None
+        if self.store is not None:
+            suggestions = self.store.get(self._store_key(word))
+
+        if suggestions is None:
+            suggestions = self._suggest(word)
+            if self.store is not None:
+                self.store.put(self._store_key(word), suggestions)
+
+        if self.cache is not None:
+            self.cache.put(word, suggestions)
+
+        return suggestions
+
+    def _suggest(self, word):
+        """Compute the correction suggestions of the candidate generator"""
+
+        if self.suggester is not None:
+            return self.suggester.get_suggestions(word)
 
         suggestions = []
         for sgt in self.hunspell.suggest(word):
@@ -64,11 +162,55 @@ class HunSpelling:
                 suggestions.append(sgt)
         return suggestions
 
-    def correct(self, query, ignore=None, topn=None):
+    def precompute_suggestions(self, words):
         """
-        Return top candidate corrections for given query.
-        The ignore flag can allow ignoring certain words
-        (e.g. named entities)
+        Fill the persistent store with the suggestions of the given
+        misspelled words not stored yet.
+        Return the number of newly stored words.
+        """
+
+        if self.store is None:
+            return 0
+
+        items = []
+        for word in set(words):
+            if word and self.is_misspelled(word) \
+                    and self._store_key(word) not in self.store:
+                items.append((self._store_key(word), self._suggest(word)))
+
+        self.store.update(items)
+        return len(items)
+
+    def cache_info(self):
+        """
+        Return the statistics of the in-memory cache ('memory')
+        and of the persistent store ('store'), None if disabled
+        """
+
+        return {
+            'memory': self.cache.stats() if self.cache is not None else None,
+            'store': self.store.stats() if self.store is not None else None,
+        }
+
+    def _clear_memory(self):
+        """Empty the in-memory cache (the dictionary changed)"""
+        if self.cache is not None:
+            self.cache.clear()
+
+    def clear_cache(self):
+        """
+        Empty the in-memory cache and the stored suggestions
+        of the current dictionary and backend
+        """
+
+        self._clear_memory()
+        if self.store is not None:
+            self.store.clear(prefix=self.namespace + ':')
+
+    def detect(self, query, ignore=None):
+        """
+        Return the flags of the tokens of given query to correct
+        (alphabetic, misspelled and not ignored)
         """
 
         if not isinstance(query, list):
@@ -77,21 +219,88 @@ class HunSpelling:
         if ignore is None:
             ignore = [0] * len(query)
 
-        solutions = []
+        return [
+            int(not ignored
+                and token.isalpha()
+                and not self.hunspell.spell(token))
+            for token, ignored in zip(query, ignore)]
+
+    def has_misspellings(self, query, ignore=None):
+        """Check if any token of given query would be corrected"""
+        return any(self.detect(query, ignore=ignore))
+
+    def suggest(self, query, misspelled):
+        """
+        Return the list of alternatives for each token of the given query:
+        the correction suggestions for the tokens flagged as misspelled,
+        the token itself otherwise
+        """
+
+        if not isinstance(query, list):
+            query = query.split()
 
-        for i, token in enumerate(query):
-            if token.isalpha() \
-                    and not self.hunspell.spell(token) \
-                    and not ignore[i]:
+        return [
+            (self.get_suggestions(token) or [token]) if flag else [token]
+            for token, flag in zip(query, misspelled)]
 
-                suggestions = self.get_suggestions(token)
+    def suggestion_lattice(self, query, ignore=None):
+        """
+        Return the list of alternatives for each token of the given query:
+        the correction suggestions for misspelled tokens,
+        the token itself otherwise.
+        The ignore flag can allow ignoring certain words
+        (e.g. named entities)
+        """
+        return self.suggest(query, self.detect(query, ignore=ignore))
+
+    def suggestion_lattices(self, queries, ignores=None):
+        """
+        Return the suggestion lattice of each given query
+        (see suggestion_lattice).
+        The alternatives of each distinct token are computed only once.
+        """
+
+        queries = [
+            query if isinstance(query, list) else query.split()
+            for query in queries]
+
+        if ignores is None:
+            ignores = [[0] * len(query) for query in queries]
+
+        alternatives = {}
+        lattices = []
+        for query, ignore in zip(queries, ignores):
+            lattice = []
+            for token, ignored in zip(query, ignore):
+                if ignored:
+                    lattice.append([token])
+                    continue
+                if token not in alternatives:
+                    alternatives[token] = self.alternatives(token)
+                lattice.append(alternatives[token])
+            lattices.append(lattice)
+        return lattices
+
+    def alternatives(self, token):
+        """
+        Return the correction suggestions of a misspelled token,
+        the token itself otherwise
+        """
+
+        if token.isalpha() and not self.hunspell.spell(token):
+            suggestions = self.get_suggestions(token)
+            if suggestions:
+                return suggestions
+        return [token]
+
+    def correct(self, query, ignore=None, topn=None):
+        """
+        Return top candidate corrections for given query.
+        The ignore flag can allow ignoring certain words
+        (e.g. named entities)
+        """
 
-                if suggestions:
-                    solutions.append(suggestions)
-                else:
-                    solutions.append([token])
-            else:
-                solutions.append([token])
+        solutions = self.suggestion_lattice(query, ignore=ignore)
 
         # merge solutions
         candidates = [' '.join(sol) for sol in product(*solutions)]
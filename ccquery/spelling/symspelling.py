@@ -0,0 +1,101 @@
+import logging
+from collections import defaultdict
+from ccquery.error import ConfigError
+from ccquery.preprocessing import load_tokens
+from ccquery.utils.str_utils import edit_distance
+
+class SymSpelling:
+    """
+    Suggest candidate corrections with the symmetric deletion algorithm
+    (SymSpell)
+
+    Focus:
+    - index the deletions (up to 'max_distance' edits) of each word prefix
+      of the vocabulary
+    - look up the deletions of a misspelled word into the index
+    - return the vocabulary words within 'max_distance' edits,
+      ordered by edit distance and by number of occurrences
+    """
+
+    def __init__(
+            self, path=None, counts=None, max_distance=2, prefix_length=7,
+            max_suggestions=10):
+        """
+        Load the vocabulary from path (json counts or text list of words
+        saved by the Vocabulary class) or from a counts dictionary,
+        then build the deletion index
+        """
+
+        if max_distance < 0 or prefix_length <= max_distance:
+            raise ConfigError(
+                "Method expects 0 <= max_distance < prefix_length")
+
+        self.logger = logging.getLogger(__name__)
+
+        if path and isinstance(path, str):
+            counts = load_tokens(path)
+        elif not counts or not isinstance(counts, dict):
+            raise ConfigError('Method expects a file path or a dictionary')
+
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.max_suggestions = max_suggestions
+
+        self.counts = counts
+        self.max_length = max(len(word) for word in counts)
+
+        self.deletes = defaultdict(list)
+        for word in counts:
+            for delete in self._deletes(word[:prefix_length], max_distance):
+                self.deletes[delete].append(word)
+        self.deletes = dict(self.deletes)
+
+        self.logger.info("Indexed {:,} words with {:,} deletions".format(
+            len(counts), len(self.deletes)))
+
+    @staticmethod
+    def _deletes(word, max_distance):
+        """Return the strings obtained by deleting up to max_distance chars"""
+
+        deletes = {word}
+        queue = [word]
+        for _ in range(max_distance):
+            new_queue = []
+            for item in queue:
+                for i in range(len(item)):
+                    delete = item[:i] + item[i + 1:]
+                    if delete not in deletes:
+                        deletes.add(delete)
+                        new_queue.append(delete)
+            queue = new_queue
+        return deletes
+
+    def lookup(self, word, max_distance=None):
+        """
+        Return the (suggestion, distance, count) tuples of the vocabulary
+        words within max_distance edits of given word,
+        ordered by distance, then by decreasing count
+        """
+
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        if len(word) - self.max_length > max_distance:
+            return []
+
+        distances = {}
+        for delete in self._deletes(word[:self.prefix_length], max_distance):
+            for suggestion in self.deletes.get(delete, []):
+                if suggestion in distances:
+                    continue
+                distances[suggestion] = edit_distance(
+                    word, suggestion, max_distance)
+
+        return sorted(
+            ((sgt, dist, self.counts[sgt])
+             for sgt, dist in distances.items() if dist <= max_distance),
+            key=lambda x: (x[1], -x[2], x[0]))
+
+    def get_suggestions(self, word):
+        """Return correction suggestions"""
+        return [sgt for sgt, _, _ in self.lookup(word)][:self.max_suggestions]
@@ -0,0 +1,159 @@
+import math
+import logging
+from array import array
+from collections import defaultdict
+from marisa_trie import Trie, BytesTrie
+from ccquery.error import ConfigError
+from ccquery.ngram import LanguageModel
+from ccquery.preprocessing import load_tokens
+
+class TrieSpelling:
+    """
+    Suggest candidate corrections with a Levenshtein automaton
+    walking a marisa trie of the vocabulary
+
+    Focus:
+    - store the vocabulary words with their unigram prior
+      (log10 probability, from the n-gram LM unigrams or from word counts)
+    - walk the trie depth-first, extending one edit-distance row per char
+      (insertions, deletions, substitutions, adjacent transpositions)
+    - prune the branches once every cell of the row exceeds max_distance
+    - return the words within max_distance edits,
+      ordered by edit distance and by unigram prior
+    """
+
+    def __init__(
+            self, path=None, counts=None, language_model=None,
+            max_distance=2, max_suggestions=10):
+        """
+        Load the vocabulary either
+        - from path (json counts or text list of words saved by the
+          Vocabulary class) or from a counts dictionary
+        - or from the unigrams of a n-gram language model
+          (LanguageModel instance or model path)
+        then build the tries
+        """
+
+        if max_distance < 0:
+            raise ConfigError("Method expects a positive max_distance")
+
+        self.logger = logging.getLogger(__name__)
+
+        self.max_distance = max_distance
+        self.max_suggestions = max_suggestions
+
+        if language_model is not None:
+            if isinstance(language_model, str):
+                language_model = LanguageModel(language_model)
+            special = {'<s>', '</s>', language_model.unk}
+            priors = {
+                word: logprob for word, logprob in language_model.unigrams()
+                if word not in special}
+        else:
+            if path and isinstance(path, str):
+                counts = load_tokens(path)
+            elif not counts or not isinstance(counts, dict):
+                raise ConfigError(
+                    'Method expects a file path, a dictionary '
+                    'or a language model')
+            total = sum(counts.values())
+            priors = {
+                word: math.log10(count / total)
+                for word, count in counts.items()}
+
+        # words and their priors, indexed by the trie IDs
+        self.trie = Trie(priors.keys())
+        self.priors = array('d', [0.0]) * len(self.trie)
+        for word, prior in priors.items():
+            self.priors[self.trie[word]] = prior
+
+        # next chars of each prefix of the vocabulary words
+        children = defaultdict(set)
+        for word in priors:
+            for i, char in enumerate(word):
+                children[word[:i]].add(char)
+        self.children = BytesTrie(
+            (prefix, ''.join(sorted(chars)).encode('utf-8'))
+            for prefix, chars in children.items())
+
+        self.logger.info("Indexed {:,} words with {:,} prefixes".format(
+            len(self.trie), len(children)))
+
+    def prior(self, word):
+        """Return the unigram prior of given word, None if unknown"""
+        if word in self.trie:
+            return self.priors[self.trie[word]]
+        return None
+
+    def _next_chars(self, prefix):
+        """Return the chars following given prefix in the vocabulary"""
+        values = self.children.get(prefix)
+        return values[0].decode('utf-8') if values else ''
+
+    def lookup(self, word, max_distance=None):
+        """
+        Return the (suggestion, distance, prior) tuples of the vocabulary
+        words within max_distance edits of given word,
+        ordered by distance, then by decreasing prior
+        """
+
+        if max_distance is None:
+            max_distance = self.max_distance
+
+        size = len(word)
+        distances = {}
+
+        # (prefix, its edit-distance row, the row of its parent)
+        stack = [('', list(range(size + 1)), None)]
+
+        while stack:
+            prefix, row, parent = stack.pop()
+
+            for char in self._next_chars(prefix):
+                candidate = prefix + char
+
+                new_row = [row[0] + 1]
+                for j in range(1, size + 1):
+                    cost = word[j - 1] != char
+                    value = min(
+                        new_row[j - 1] + 1, row[j] + 1, row[j - 1] + cost)
+                    if parent is not None and j > 1 \
+                            and word[j - 1] == prefix[-1] \
+                            and word[j - 2] == char:
+                        value = min(value, parent[j - 2] + 1)
+                    new_row.append(value)
+
+                lowest = min(new_row)
+                if lowest > max_distance:
+                    continue
+
+                if new_row[-1] <= max_distance and candidate in self.trie:
+                    distances[candidate] = new_row[-1]
+
+                if lowest == max_distance:
+                    # no edit left: only the exact continuations remain
+                    for j in range(size):
+                        if new_row[j] == max_distance:
+                            completion = candidate + word[j:]
+                            if completion in self.trie:
+                                distances.setdefault(completion, max_distance)
+
+                    # or the transposition of the last char, then the rest
+                    for j in range(2, size + 1):
+                        if row[j - 2] + 1 <= max_distance \
+                                and word[j - 1] == char:
+                            completion = candidate + word[j - 2] + word[j:]
+                            if completion in self.trie:
+                                distances.setdefault(completion, max_distance)
+                    continue
+
+                stack.append((candidate, new_row, row))
+
+        return sorted(
+            ((sgt, dist, self.priors[self.trie[sgt]])
+             for sgt, dist in distances.items()),
+            key=lambda x: (x[1], -x[2], x[0]))
+
+    def get_suggestions(self, word):
+        """Return correction suggestions"""
+        return [sgt for sgt, _, _ in self.lookup(word)][:self.max_suggestions]
@@ -1 +1,3 @@
-from . import io_utils, str_utils, cfg_utils, plot_utils
+from . import \
+    io_utils, str_utils, cfg_utils, plot_utils, cache_utils, metric_utils, \
+    concurrency_utils, process_utils
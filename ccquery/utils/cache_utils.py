@@ -0,0 +1,339 @@
+"""Bounded in-memory and persistent on-disk key-value caches"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from ccquery.error import ConfigError
+from ccquery.utils import io_utils
+
+class MemoryCache:
+    """
+    Thread-safe bounded in-memory cache,
+    with an optional time-to-live of the entries (in seconds)
+    and hits / misses / evictions / expirations statistics.
+    The subclasses define the eviction policy
+    (_touch, _insert, _remove and _evict methods).
+    """
+
+    policy = None
+
+    def __init__(self, maxsize, ttl=None):
+        """Keep at most 'maxsize' entries, for at most 'ttl' seconds"""
+
+        if maxsize < 1 or (ttl is not None and ttl <= 0):
+            raise ConfigError('Cache expects a positive maxsize and ttl')
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        item = self.data.get(key)
+        return item is not None and not self._expired(item)
+
+    def _expiry(self):
+        """Return the expiry time of an entry stored now"""
+        return None if self.ttl is None else time.monotonic() + self.ttl
+
+    @staticmethod
+    def _expired(item):
+        """Check if the (value, expiry, ...) entry expired"""
+        return item[1] is not None and item[1] <= time.monotonic()
+
+    # eviction policy, called with the lock held
+
+    def _touch(self, key):
+        """Record an access to the stored key"""
+        raise NotImplementedError
+
+    def _insert(self, key, item):
+        """Store the [value, expiry] item of a new key"""
+        raise NotImplementedError
+
+    def _remove(self, key):
+        """Remove the stored key"""
+        raise NotImplementedError
+
+    def _evict(self):
+        """Remove the entry to evict when the cache is full"""
+        raise NotImplementedError
+
+    def get(self, key, default=None):
+        """Return the value stored for given key, default if absent"""
+
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None and self._expired(item):
+                self._remove(key)
+                self.expirations += 1
+                item = None
+
+            if item is None:
+                self.misses += 1
+                return default
+
+            self._touch(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        """Store the value of given key, evict an entry if full"""
+
+        with self.lock:
+            if key in self.data:
+                self.data[key][:2] = [value, self._expiry()]
+                self._touch(key)
+                return
+
+            if len(self.data) >= self.maxsize:
+                self._evict()
+                self.evictions += 1
+            self._insert(key, [value, self._expiry()])
+
+    def clear(self):
+        """Remove every entry and reset the statistics"""
+
+        with self.lock:
+            self.data = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+
+    def stats(self):
+        """Return the usage statistics of the cache"""
+
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'size': len(self.data),
+            'maxsize': self.maxsize,
+        }
+
+class LRUCache(MemoryCache):
+    """Bounded cache evicting the least recently used entries"""
+
+    policy = 'lru'
+
+    def _touch(self, key):
+        self.data.move_to_end(key)
+
+    def _insert(self, key, item):
+        self.data[key] = item
+
+    def _remove(self, key):
+        del self.data[key]
+
+    def _evict(self):
+        self.data.popitem(last=False)
+
+class LFUCache(MemoryCache):
+    """
+    Bounded cache evicting the least frequently used entries
+    (the least recently used one among them)
+    """
+
+    policy = 'lfu'
+
+    def clear(self):
+        """Remove every entry and reset the statistics"""
+
+        super().clear()
+        with self.lock:
+            # keys by number of uses, from the least recently used
+            self.frequencies = {}
+            self.min_frequency = 0
+
+    def _touch(self, key):
+        item = self.data[key]
+        self._unlink(key, item[2])
+        item[2] += 1
+        self.frequencies.setdefault(item[2], OrderedDict())[key] = None
+
+    def _insert(self, key, item):
+        self.data[key] = item + [1]
+        self.frequencies.setdefault(1, OrderedDict())[key] = None
+        self.min_frequency = 1
+
+    def _remove(self, key):
+        self._unlink(key, self.data.pop(key)[2])
+
+    def _unlink(self, key, frequency):
+        keys = self.frequencies[frequency]
+        del keys[key]
+        if not keys:
+            del self.frequencies[frequency]
+            if self.min_frequency == frequency:
+                self.min_frequency = frequency + 1
+
+    def _evict(self):
+        if self.min_frequency not in self.frequencies:
+            self.min_frequency = min(self.frequencies)
+        key = next(iter(self.frequencies[self.min_frequency]))
+        self._remove(key)
+
+# eviction policies of the in-memory caches
+CACHE_POLICIES = {
+    'lru': LRUCache,
+    'lfu': LFUCache,
+}
+
+def create_cache(maxsize, policy='lru', ttl=None):
+    """Return an in-memory cache with given eviction policy"""
+
+    if policy not in CACHE_POLICIES:
+        raise ConfigError("Unknown cache policy '{}', expected one of {}"
+                          .format(policy, sorted(CACHE_POLICIES)))
+    return CACHE_POLICIES[policy](maxsize, ttl=ttl)
+
+class PersistentCache:
+    """
+    Persistent key-value store of JSON-serializable values,
+    kept into a sqlite database file (memory-mapped reads).
+    The file survives restarts and can be shared by several processes
+    (each process opens its own connection).
+    """
+
+    def __init__(self, path, mmap_size=256):
+        """
+        Open (or create) the store file.
+        Map up to 'mmap_size' MB of the database in memory.
+        """
+
+        io_utils.create_path(path)
+
+        self.path = path
+        self.mmap_size = int(mmap_size * 2 ** 20)
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._pid = None
+        self._connection = None
+
+        # the number of entries is kept up to date by triggers
+        # (no full scan of the table to report the size of the store)
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_size '
+                '(size INTEGER NOT NULL)')
+            self.connection.execute(
+                'INSERT INTO cache_size SELECT COUNT(*) FROM cache '
+                'WHERE NOT EXISTS (SELECT 1 FROM cache_size)')
+            self.connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_insert '
+                'AFTER INSERT ON cache '
+                'BEGIN UPDATE cache_size SET size = size + 1; END')
+            self.connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_delete '
+                'AFTER DELETE ON cache '
+                'BEGIN UPDATE cache_size SET size = size - 1; END')
+            self.connection.commit()
+
+    @property
+    def connection(self):
+        """Return the connection of the current process (reopen after fork)"""
+
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(
+                'PRAGMA mmap_size={}'.format(self.mmap_size))
+            # the rows replaced by INSERT OR REPLACE fire the delete trigger
+            self._connection.execute('PRAGMA recursive_triggers=ON')
+            self._pid = os.getpid()
+        return self._connection
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT size FROM cache_size').fetchone()[0]
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT 1 FROM cache WHERE key = ?', (key,)
+            ).fetchone() is not None
+
+    def get(self, key, default=None):
+        """Return the value stored for given key, default if absent"""
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        """Store the value of given key"""
+        self.update([(key, value)])
+
+    def update(self, items):
+        """Store the (key, value) pairs within a single transaction"""
+
+        with self.lock:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                ((key, json.dumps(value, ensure_ascii=False))
+                 for key, value in items))
+            self.connection.commit()
+
+    def clear(self, prefix=None):
+        """
+        Remove every entry (only the keys starting with prefix, if given)
+        and reset the statistics
+        """
+
+        with self.lock:
+            if prefix:
+                self.connection.execute(
+                    'DELETE FROM cache WHERE substr(key, 1, ?) = ?',
+                    (len(prefix), prefix))
+            else:
+                self.connection.execute('DELETE FROM cache')
+            self.connection.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """Close the connection of the current process"""
+
+        with self.lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._pid = None
+
+    def stats(self):
+        """Return the usage statistics of the store"""
+
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'size': len(self),
+        }
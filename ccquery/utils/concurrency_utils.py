@@ -0,0 +1,193 @@
+"""Share computations between the concurrent threads of a service"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from ccquery.error import ConfigError, DataError
+from ccquery.utils.metric_utils import Histogram, COUNT_BUCKETS
+
+LOGGER = logging.getLogger(__name__)
+
+class _Call:
+    """Result of a computation in flight, awaited by its callers"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesce the concurrent calls computing the same key:
+    the first caller computes the result,
+    the duplicate callers wait for it instead of computing it again
+    """
+
+    def __init__(self):
+        """Start without calls in flight"""
+
+        self.lock = threading.Lock()
+        self.calls = {}
+
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Return the result of function(*args, **kwargs),
+        shared with the concurrent calls of the same key
+        (the exception raised by the computation, if any, is raised to
+        every caller)
+        """
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        """Return the number of executed and of coalesced calls"""
+
+        with self.lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self.calls),
+            }
+
+class MicroBatcher:
+    """
+    Group the items submitted by concurrent threads into batches:
+    a background thread waits at most 'max_wait' seconds after the first
+    item of a batch for other items (at most 'max_batch_size'),
+    processes the whole batch with a single call,
+    then hands its result to each waiting thread
+    """
+
+    def __init__(self, function, max_batch_size=64, max_wait=0.005):
+        """
+        Process the batches with function (list of items -> list of results,
+        in the same order)
+        """
+
+        if max_batch_size < 1 or max_wait < 0:
+            raise ConfigError(
+                'Batcher expects a positive max_batch_size and max_wait')
+
+        self.function = function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.lock = threading.Lock()
+        self.batch_sizes = Histogram(COUNT_BUCKETS)
+        self.waits = Histogram()
+
+        self._pid = None
+        self._queue = None
+
+    def _start(self):
+        """Start the batching thread of the current process (after fork)"""
+
+        with self.lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                thread = threading.Thread(
+                    target=self._run, args=(self._queue,), daemon=True)
+                thread.start()
+                self._pid = os.getpid()
+        return self._queue
+
+    def submit(self, item):
+        """Return the result of given item, processed within a batch"""
+
+        call = _Call()
+        self._start().put((item, call, time.perf_counter()))
+
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _collect(self, requests):
+        """Return the next batch of (item, call, submission time)"""
+
+        batch = [requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    batch.append(requests.get(timeout=timeout))
+                else:
+                    batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _process(self, batch):
+        """Process a batch, keep the result of each call"""
+
+        start = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        for _, _, submitted in batch:
+            self.waits.observe(start - submitted)
+
+        results = self.function([item for item, _, _ in batch])
+        if len(results) != len(batch):
+            raise DataError('Batch of {} items returned {} results'.format(
+                len(batch), len(results)))
+
+        for (_, call, _), result in zip(batch, results):
+            call.result = result
+
+    def _run(self, requests):
+        """
+        Process the batches of submitted items
+        (the exception raised by a batch, if any, is logged and raised to
+        each of its callers, the thread keeps processing the next batches)
+        """
+
+        while True:
+            batch = []
+            try:
+                batch = self._collect(requests)
+                self._process(batch)
+            except Exception as exc:
+                LOGGER.exception(
+                    'Failed to process a batch of {} items'.format(len(batch)))
+                for _, call, _ in batch:
+                    call.error = exc
+            finally:
+                for _, call, _ in batch:
+                    call.event.set()
+
+    def stats(self):
+        """Return the summaries of the batch sizes and of the waits"""
+
+        return {
+            'batch_sizes': self.batch_sizes.summary(),
+            'waits': self.waits.summary(),
+        }
@@ -1,12 +1,28 @@
 """Execute useful file and folder commands"""
 
+import io
 import os
-import urllib
 import bz2
+import gzip
+import lzma
+import hashlib
 import shutil
+import urllib
+import subprocess
+from contextlib import contextmanager
 
 from ccquery.error import ConfigError, DataError, CaughtException
 
+# python modules decompressing files, by file extension
+DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+# parallel decompressors (separate processes), by order of preference
+PARALLEL_DECOMPRESSORS = {
+    '.gz': [['pigz', '-dc', '-p', '{threads}']],
+    '.bz2': [['lbzip2', '-dc', '-n', '{threads}'], ['pbzip2', '-dc', '-p{threads}']],
+    '.xz': [['xz', '-dc', '-T', '{threads}']],
+}
+
 def check_file_readable(input_file):
     """Check file existance"""
     if not os.path.exists(input_file):
@@ -72,6 +88,17 @@ def count_lines(input_file):
             n += 1
     return n
 
+def checksum(input_file, blocksize=2**20):
+    """Return the SHA-1 hex digest of the contents of a file"""
+
+    check_file_readable(input_file)
+
+    digest = hashlib.sha1()
+    with open(input_file, 'rb') as istream:
+        for block in iter(lambda: istream.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 def dirname(input_file):
     """Recover file dirname"""
     return os.path.dirname(input_file)
@@ -124,3 +151,61 @@ def decompress(path, output, blocksize=900*1024):
             z = bz2.BZ2Decompressor()
             for block in iter(lambda: istream.read(blocksize), b''):
                 ostream.write(z.decompress(block))
+
+def is_compressed(input_file):
+    """Check if given file is a gz, bz2 or xz archive"""
+    return extension(input_file) in DECOMPRESSORS
+
+def strip_compression(input_file):
+    """Recover the path of the archived file (remove archive extension)"""
+    if is_compressed(input_file):
+        return path_without_ext(input_file)
+    return input_file
+
+def decompression_command(input_file, threads=None):
+    """
+    Return the command of an available parallel decompressor
+    for given archive file, None if none is available
+    """
+
+    threads = str(threads or os.cpu_count() or 1)
+    for command in PARALLEL_DECOMPRESSORS.get(extension(input_file), []):
+        if shutil.which(command[0]):
+            return [arg.format(threads=threads) for arg in command] \
+                + [input_file]
+    return None
+
+@contextmanager
+def open_text(input_file, encoding='utf-8', threads=None):
+    """
+    Open a (possibly compressed) text file for reading
+
+    Decompress gz, bz2 and xz archives on the fly
+    - preferably with a multi-threaded decompressor (pigz, lbzip2, pbzip2, xz)
+      running in a separate process, in parallel with the reading
+    - otherwise with the python gzip, bz2 and lzma modules
+    """
+
+    check_file_readable(input_file)
+
+    command = None
+    if is_compressed(input_file):
+        command = decompression_command(input_file, threads)
+
+    if not command:
+        opener = DECOMPRESSORS.get(extension(input_file), open)
+        with opener(input_file, 'rt', encoding=encoding) as istream:
+            yield istream
+        return
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        yield io.TextIOWrapper(process.stdout, encoding=encoding)
+    finally:
+        # a decompressor still writing gets a SIGPIPE (negative return code)
+        process.stdout.close()
+        code = process.wait()
+
+    if code > 0:
+        raise DataError("Failed to decompress '{}' ({} exited with {})".format(
+            input_file, command[0], code))
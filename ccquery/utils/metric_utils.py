@@ -0,0 +1,247 @@
+"""
+Measure durations, aggregate observations into histograms
+and render them in the Prometheus text exposition format
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from ccquery.error import ConfigError
+
+# upper bounds of the buckets of durations (in seconds)
+DURATION_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# upper bounds of the buckets of counts
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+class Histogram:
+    """
+    Thread-safe histogram of observed values
+    over fixed buckets (upper bounds, the last bucket being unbounded)
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        """Define the buckets by their upper bounds"""
+
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Remove every observation"""
+
+        with self.lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = None
+
+    def observe(self, value):
+        """Add an observation into the bucket of given value"""
+
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        """
+        Return a consistent copy of the (bucket counts, count, sum, max)
+        of the observations
+        """
+
+        with self.lock:
+            return list(self.counts), self.count, self.sum, self.max
+
+    def cumulative_counts(self, snapshot=None):
+        """
+        Return the (upper bound, number of observations <= bound) pairs
+        (of given snapshot, if any)
+        """
+
+        counts = (snapshot or self.snapshot())[0]
+
+        total = 0
+        cumulative = []
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def quantile(self, q, snapshot=None):
+        """
+        Return the upper bound of the bucket holding the q-quantile,
+        at most the largest observation (None without observations)
+        """
+
+        snapshot = snapshot or self.snapshot()
+        cumulative = self.cumulative_counts(snapshot)
+        total = cumulative[-1][1]
+        if not total:
+            return None
+
+        maximum = snapshot[3]
+        for bound, count in cumulative:
+            if count >= q * total:
+                return min(bound, maximum)
+        return maximum
+
+    def summary(self):
+        """Return the count, sum, mean and approximate quantiles"""
+
+        snapshot = self.snapshot()
+        _, count, total, _ = snapshot
+
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'mean': round(total / count, 6) if count else None,
+            'p50': self.quantile(0.5, snapshot),
+            'p90': self.quantile(0.9, snapshot),
+            'p99': self.quantile(0.99, snapshot),
+        }
+
+class StageTimer:
+    """Measure the durations of the successive stages of a process"""
+
+    def __init__(self):
+        """Start with no measured stage"""
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Add the duration of the enclosed block to the named stage"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = \
+                self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def total(self):
+        """Return the sum of the stage durations"""
+        return sum(self.timings.values())
+
+def _format_number(value):
+    """Format a sample value of the text exposition format"""
+
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _format_labels(labels):
+    """Format the {name="value",...} labels of a sample"""
+
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value)
+                         .replace('\\', '\\\\')
+                         .replace('"', '\\"')
+                         .replace('\n', '\\n'))
+        for name, value in labels.items()) + '}'
+
+class Exposition:
+    """
+    Render metrics in the Prometheus text exposition format
+    (each metric family given once, with all its labelled samples,
+    the counters named with their '_total' suffix)
+    """
+
+    def __init__(self, prefix='ccquery', labels=None):
+        """
+        Prefix the names of the metrics,
+        add the given labels to every sample (e.g. the worker process)
+        """
+
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+        self.lines = []
+        self.names = set()
+
+    def _family(self, name, kind, description):
+        """Add the header of a metric family, return its full name"""
+
+        name = '{}_{}'.format(self.prefix, name) if self.prefix else name
+        if name in self.names:
+            raise ConfigError("Metric '{}' defined twice".format(name))
+        self.names.add(name)
+
+        self.lines.append('# HELP {} {}'.format(name, description))
+        self.lines.append('# TYPE {} {}'.format(name, kind))
+        return name
+
+    @staticmethod
+    def _samples(values):
+        """Return the (labels, value) samples of a value or of a list"""
+
+        if isinstance(values, (list, tuple)):
+            return values
+        return [({}, values)]
+
+    def _sample(self, name, labels, value):
+        self.lines.append('{}{} {}'.format(
+            name, _format_labels(dict(self.labels, **labels)),
+            _format_number(value)))
+
+    def counter(self, name, description, values):
+        """Add a counter (value, or list of (labels, value) samples)"""
+
+        if not name.endswith('_total'):
+            name += '_total'
+
+        name = self._family(name, 'counter', description)
+        for labels, value in self._samples(values):
+            self._sample(name, labels, value)
+
+    def gauge(self, name, description, values):
+        """Add a gauge (value, or list of (labels, value) samples)"""
+
+        name = self._family(name, 'gauge', description)
+        for labels, value in self._samples(values):
+            self._sample(name, labels, value)
+
+    def histogram(self, name, description, histograms):
+        """Add a histogram (Histogram, or list of (labels, Histogram))"""
+
+        name = self._family(name, 'histogram', description)
+        for labels, histogram in self._samples(histograms):
+            snapshot = histogram.snapshot()
+            for bound, count in histogram.cumulative_counts(snapshot):
+                self._sample(
+                    name + '_bucket', dict(labels, le=_format_number(bound)),
+                    count)
+            self._sample(name + '_sum', labels, round(snapshot[2], 6))
+            self._sample(name + '_count', labels, snapshot[1])
+
+    def caches(self, caches):
+        """
+        Add the usage of caches from their (labels, stats) pairs
+        (see the stats method of the caches of utils.cache_utils)
+        """
+
+        for key, kind, description in [
+                ('hits', 'counter', 'Number of cache hits'),
+                ('misses', 'counter', 'Number of cache misses'),
+                ('evictions', 'counter', 'Number of evicted cache entries'),
+                ('expirations', 'counter', 'Number of expired cache entries'),
+                ('hit_rate', 'gauge', 'Ratio of lookups found in cache'),
+                ('size', 'gauge', 'Number of cache entries')]:
+            samples = [
+                (labels, stats[key]) for labels, stats in caches
+                if key in stats]
+            if samples:
+                getattr(self, kind)('cache_' + key, description, samples)
+
+    def render(self):
+        """Return the text of the metrics"""
+        return '\n'.join(self.lines) + '\n'
@@ -0,0 +1,159 @@
+"""Run pre-forked worker processes and measure their memory"""
+
+import os
+import gc
+import time
+import signal
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# fields of /proc/<pid>/smaps_rollup (in kB), summed into each measure
+MEMORY_FIELDS = {
+    'rss': ['Rss'],
+    'pss': ['Pss'],
+    'shared': ['Shared_Clean', 'Shared_Dirty'],
+    'private': ['Private_Clean', 'Private_Dirty'],
+}
+
+def memory_usage(pid='self'):
+    """
+    Return the resident memory of given process (in bytes):
+    'rss' (resident), 'pss' (proportional share of the pages shared with
+    other processes), 'shared' and 'private' pages.
+    Only the 'rss' is known without smaps_rollup (Linux >= 4.14),
+    None is returned without /proc (not Linux)
+    """
+
+    values = {}
+    try:
+        path = '/proc/{}/smaps_rollup'.format(pid)
+        with open(path, encoding='utf-8', errors='replace') as istream:
+            for line in istream:
+                fields = line.split()
+                if len(fields) == 3 and fields[2] == 'kB':
+                    values[fields[0].rstrip(':')] = int(fields[1]) * 1024
+        return {
+            measure: sum(values.get(field, 0) for field in fields)
+            for measure, fields in MEMORY_FIELDS.items()}
+    except OSError:
+        pass
+
+    try:
+        path = '/proc/{}/status'.format(pid)
+        with open(path, encoding='utf-8', errors='replace') as istream:
+            for line in istream:
+                if line.startswith('VmRSS:'):
+                    return {'rss': int(line.split()[1]) * 1024}
+    except OSError:
+        pass
+    return None
+
+def children(pid):
+    """Return the IDs of the child processes of given process"""
+
+    try:
+        path = '/proc/{0}/task/{0}/children'.format(pid)
+        with open(path, encoding='utf-8') as istream:
+            return [int(child) for child in istream.read().split()]
+    except OSError:
+        return []
+
+def prefork(serve, workers, max_failures=5, min_uptime=1.0, backoff=0.1):
+    """
+    Fork 'workers' processes running the serve function,
+    after loading everything into the current (master) process:
+    the workers share the memory pages of the master (copy-on-write)
+    until they modify them.
+    The master restarts the workers exiting on errors, after a delay
+    doubling from 'backoff' seconds with each failure occurring within
+    'min_uptime' seconds of the start of the worker, and gives up
+    on a worker after 'max_failures' such consecutive failures.
+    The master stops the workers on SIGINT or SIGTERM.
+    """
+
+    # keep the loaded objects out of the garbage collector
+    # (its reference counts would copy the shared pages)
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+    pids = {}
+    starts = {}
+    failures = dict.fromkeys(range(workers), 0)
+    stopping = []
+
+    def spawn(number):
+        """Fork a worker process (which never returns)"""
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                serve()
+                status = 0
+            except BaseException:
+                LOGGER.exception("Worker {} failed".format(os.getpid()))
+            finally:
+                os._exit(status)
+
+        pids[pid] = number
+        starts[number] = time.monotonic()
+        LOGGER.info("Started worker {} (pid {})".format(number, pid))
+
+    def stop(signum, _frame):
+        """Stop every worker"""
+
+        stopping.append(signum)
+        for pid in list(pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as exc:
+                LOGGER.warning("Cannot stop worker (pid {}): {}".format(
+                    pid, exc))
+
+    handlers = {
+        signum: signal.signal(signum, stop)
+        for signum in (signal.SIGINT, signal.SIGTERM)}
+
+    try:
+        for number in range(workers):
+            spawn(number)
+
+        while pids:
+            try:
+                pid, status = os.wait()
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+
+            number = pids.pop(pid, None)
+            if number is None or status == 0 or stopping:
+                continue
+
+            if time.monotonic() - starts[number] < min_uptime:
+                failures[number] += 1
+            else:
+                failures[number] = 0
+
+            if failures[number] >= max_failures:
+                LOGGER.error(
+                    "Worker {} (pid {}) exited ({}), failed {} times "
+                    "in a row, not restarting".format(
+                        number, pid, status, failures[number]))
+                continue
+
+            delay = backoff * 2 ** (failures[number] - 1) \
+                if failures[number] else 0
+            LOGGER.warning(
+                "Worker {} (pid {}) exited ({}), restarting in {:.2f}s"
+                .format(number, pid, status, delay))
+            time.sleep(delay)
+            if not stopping:
+                spawn(number)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
@@ -153,3 +153,47 @@ def sentences(text):
 def remove_spaces_apostrophes(text):
     """Remove spaces following apostrophes"""
     return regex.sub(r"' +", "'", text)
+
+def normalize_query(text):
+    """
+    Normalize a query before using it as a key:
+    unicode composition (NFC), lowercase, single spaces
+    """
+    return ' '.join(unicodedata.normalize('NFC', text).lower().split())
+
+def edit_distance(source, target, max_distance=None):
+    """
+    Return the Damerau-Levenshtein distance between two words
+    (insertions, deletions, substitutions, transpositions of adjacent chars).
+    Stop early and return max_distance + 1 once the distance is exceeded.
+    """
+
+    if max_distance is None:
+        max_distance = max(len(source), len(target))
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+
+    # rows i - 2 (before, read from i = 2), i - 1 (previous) and i (current)
+    previous = list(range(len(target) + 1))
+    current = list(range(len(target) + 1))
+
+    for i in range(1, len(source) + 1):
+        before, previous = previous, current
+        current = [i] + [0] * len(target)
+
+        for j in range(1, len(target) + 1):
+            cost = source[i - 1] != target[j - 1]
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + cost)
+
+            if i > 1 and j > 1 \
+                    and source[i - 1] == target[j - 2] \
+                    and source[i - 2] == target[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+
+        if min(current) > max_distance:
+            return max_distance + 1
+
+    return min(current[-1], max_distance + 1)
@@ -57,6 +57,10 @@ setup(
             'flask-compress >= 1.4',
             'flasgger >= 0.8',
         ],
+        'asgi': [
+            'uvicorn >= 0.11',
+            'jinja2 >= 2.10',
+        ],
     },
     command_options={
         'build_sphinx': {
@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import asyncio
+import unittest
+import importlib.util
+from urllib.parse import quote
+from ccquery.utils import io_utils
+
+def load_module(path, name):
+    """Import a python file as a module"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+class TestASGI(unittest.TestCase):
+    """Test the asynchronous variant of the REST API"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Load the application with the sample models"""
+
+        folder = os.path.dirname(__file__)
+        spelling = os.path.join(folder, '..', 'spelling')
+        cls.config = os.path.join(folder, 'sample-asgi.cfg')
+        with open(cls.config, 'w', encoding='utf-8') as ostream:
+            ostream.write("CCQUERY = {}\n".format({
+                'spacy': {'model': 'fr_core_news_sm'},
+                'hunspell': {
+                    'dic': os.path.join(spelling, 'index.dic'),
+                    'aff': os.path.join(spelling, 'index.aff')},
+                'ngram': {
+                    'model': os.path.join(
+                        folder, '..', 'ngram', 'sample-model.bin')},
+            }))
+            ostream.write("ASYNC_WORKERS = 2\n")
+
+        os.environ['CCQUERY_CONFIG'] = cls.config
+        try:
+            cls.api = load_module(
+                os.path.join(folder, '..', '..', 'bin', 'baseline1_asgi.py'),
+                'baseline1_asgi')
+        finally:
+            del os.environ['CCQUERY_CONFIG']
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove temporary files"""
+        io_utils.delete_file(cls.config)
+
+    async def call(self, path, method='GET', query='', accept=None, body=None):
+        """Send a request, return its status, headers and body"""
+
+        headers = []
+        if accept:
+            headers.append((b'accept', accept.encode()))
+        if body is not None:
+            headers.append(
+                (b'content-type', b'application/x-www-form-urlencoded'))
+
+        scope = {
+            'type': 'http',
+            'path': path,
+            'method': method,
+            'query_string': query.encode(),
+            'headers': headers}
+
+        async def receive():
+            return {'type': 'http.request', 'body': (body or '').encode()}
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await self.api.app(scope, receive, send)
+        return (
+            messages[0]['status'],
+            dict(messages[0]['headers']),
+            messages[1]['body'].decode('utf-8'))
+
+    def request(self, *args, **kwargs):
+        """Send a request, decode its json response"""
+
+        status, _, body = asyncio.run(self.call(*args, **kwargs))
+        return status, json.loads(body) if body else None
+
+    def test_json(self):
+        """Correct a query"""
+
+        query = 'comment rehoindre une force'
+        status, response = self.request(
+            '/', query='query=' + quote(query), accept='application/json')
+
+        self.assertEqual(200, status)
+        self.assertEqual(query, response['query'])
+        self.assertEqual(
+            self.api.ctool.correct(query, 1)[0], response['clean_query'])
+        self.assertFalse('degradation' in response)
+
+        # the query is required
+        status, _ = self.request('/', accept='application/json')
+        self.assertEqual(400, status)
+
+        status, _ = self.request('/unknown')
+        self.assertEqual(404, status)
+
+    def test_negotiation(self):
+        """Answer with the html form or with json"""
+
+        status, headers, body = asyncio.run(
+            self.call('/', accept='text/html,*/*;q=0.8'))
+        self.assertEqual(200, status)
+        self.assertTrue(headers[b'content-type'].startswith(b'text/html'))
+        self.assertTrue('<form' in body)
+
+        query = 'serrue en applique'
+        status, headers, body = asyncio.run(self.call(
+            '/', method='POST', accept='text/html',
+            body='query=' + quote(query)))
+        self.assertEqual(200, status)
+        self.assertTrue(self.api.ctool.correct(query, 1)[0] in body)
+
+        # no Accept header, as any media type, defaults to json
+        status, response = self.request('/', query='query=' + quote(query))
+        self.assertEqual(200, status)
+        self.assertEqual(query, response['query'])
+
+        status, _ = self.request(
+            '/', query='query=' + quote(query), accept='image/png')
+        self.assertEqual(406, status)
+
+    def test_details(self):
+        """Report the details of the correction, within a budget"""
+
+        query = 'pain de mie japonaid'
+        status, response = self.request(
+            '/', query='query={}&details=1&budget=10'.format(quote(query)),
+            accept='application/json')
+        self.assertEqual(200, status)
+        self.assertEqual('full', response['degradation'])
+        self.assertTrue('total' in response['details']['timings'])
+
+        status, response = self.request(
+            '/', query='query={}&budget=10'.format(quote(query)),
+            accept='application/json')
+        self.assertEqual(200, status)
+        self.assertEqual('full', response['degradation'])
+        self.assertFalse('details' in response)
+
+    def test_coalescing(self):
+        """Correct the concurrent identical queries only once"""
+
+        async def correct_all():
+            return await asyncio.gather(*[
+                self.call(
+                    '/', query='query=dance+polynesienne',
+                    accept='application/json')
+                for _ in range(3)])
+
+        executions = self.api.coalescing['executions']
+        coalesced = self.api.coalescing['coalesced']
+        responses = asyncio.run(correct_all())
+
+        self.assertEqual([200] * 3, [status for status, _, _ in responses])
+        self.assertEqual(1, self.api.coalescing['executions'] - executions)
+        self.assertEqual(2, self.api.coalescing['coalesced'] - coalesced)
+
+        status, response = self.request('/stats')
+        self.assertEqual(200, status)
+        self.assertEqual(0, response['coalescing']['in_flight'])
+        self.assertEqual(0, response['service']['pending'])
+
+    def test_backpressure(self):
+        """Reject the new corrections beyond the number of pending ones"""
+
+        cached = 'query=' + quote('serrue en applique')
+        status, _ = self.request('/', query=cached, accept='application/json')
+        self.assertEqual(200, status)
+
+        queue_size = self.api.queue_size
+        self.api.queue_size = 0
+        try:
+            status, response = self.request(
+                '/', query='query=meilleur+voeu', accept='application/json')
+            self.assertEqual(503, status)
+            self.assertTrue('error' in response)
+
+            status, response = self.request(
+                '/', query='query=meilleur+voeu&details=1',
+                accept='application/json')
+            self.assertEqual(503, status)
+
+            # the cached corrections are still answered
+            status, response = self.request(
+                '/', query=cached, accept='application/json')
+            self.assertEqual(200, status)
+            self.assertEqual('serrue en applique', response['query'])
+
+            status, response = self.request(
+                '/', query=cached + '&budget=1', accept='application/json')
+            self.assertEqual(200, status)
+            self.assertEqual('full', response['degradation'])
+        finally:
+            self.api.queue_size = queue_size
+
+    def test_lifespan(self):
+        """Start the pool of workers before serving the requests"""
+
+        executor = self.api.executor
+        self.api.executor = None
+
+        messages = iter([
+            {'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        try:
+            asyncio.run(self.api.app({'type': 'lifespan'}, receive, send))
+            self.assertTrue(self.api.executor is not None)
+        finally:
+            self.api.executor = executor
+
+        self.assertEqual(
+            ['lifespan.startup.complete', 'lifespan.shutdown.complete'], sent)
@@ -1,4 +1,6 @@
 import os
+import gzip
+import shutil
 import filecmp
 import unittest
 from ccquery.ngram import ArpaLanguageModel
@@ -13,14 +15,16 @@ class TestArpaLM(unittest.TestCase):
         self.arpa = os.path.join(os.path.dirname(__file__), 'sample-model.arpa')
         self.bin = io_utils.change_extension(self.arpa, 'bin')
         self.tmp = io_utils.change_extension(self.arpa, 'tmp.bin')
+        self.archive = io_utils.change_extension(self.arpa, 'tmp.arpa.gz')
 
         io_utils.check_file_readable(self.arpa)
         io_utils.check_file_readable(self.bin)
 
     def tearDown(self):
-        """Remove temporary file"""
+        """Remove temporary files"""
         if os.path.exists(self.tmp):
             os.remove(self.tmp)
+        io_utils.delete_file(self.archive)
 
     def test_load_model(self):
         """Test loading a n-gram language model from an arpa file"""
@@ -40,3 +44,18 @@ class TestArpaLM(unittest.TestCase):
         self.assertTrue(
             filecmp.cmp(self.bin, self.tmp, shallow=False),
             'Generated model different from reference model')
+
+    def test_compressed_model(self):
+        """Test loading a n-gram language model from a compressed arpa file"""
+
+        with open(self.arpa, 'rb') as istream:
+            with gzip.open(self.archive, 'wb') as ostream:
+                shutil.copyfileobj(istream, ostream)
+
+        model = ArpaLanguageModel(self.archive, threads=2)
+        self.assertEqual(model.order, 3)
+        model.save_trie(self.tmp)
+
+        self.assertTrue(
+            filecmp.cmp(self.bin, self.tmp, shallow=False),
+            'Generated model different from reference model')
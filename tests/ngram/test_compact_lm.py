@@ -0,0 +1,110 @@
+import os
+import filecmp
+import unittest
+import numpy as np
+from ccquery.ngram import ArpaLanguageModel, CompactModel, LanguageModel
+from ccquery.utils import io_utils
+
+def read_data(file, to_float=False):
+    """Read contents of file"""
+    data = []
+    with open(file, encoding='utf-8') as istream:
+        for line in istream:
+            if to_float:
+                data.append(float(line.strip()))
+            else:
+                data.append(line.strip())
+    return data
+
+class TestCompactLM(unittest.TestCase):
+    """Test the compact integer-ID n-gram language model"""
+
+    def setUp(self):
+        """Set up local variables"""
+
+        self.arpa = os.path.join(os.path.dirname(__file__), 'sample-model.arpa')
+        self.bin = io_utils.change_extension(self.arpa, 'bin')
+        self.tmp = io_utils.change_extension(self.arpa, 'tmp.cbin')
+        self.tmp_chunks = io_utils.change_extension(self.arpa, 'tmp2.cbin')
+        sqfile = os.path.join(os.path.dirname(__file__), 'sample-sentences.txt')
+        scfile = os.path.join(os.path.dirname(__file__), 'sample-scores.txt')
+
+        io_utils.check_file_readable(self.arpa)
+        io_utils.check_file_readable(self.bin)
+
+        self.data = read_data(sqfile)
+        self.scores = read_data(scfile, to_float=True)
+
+        model = ArpaLanguageModel(self.arpa, build_trie=False)
+        model.save_compact(self.tmp)
+
+    def tearDown(self):
+        """Remove temporary files"""
+        io_utils.delete_file(self.tmp)
+        io_utils.delete_file(self.tmp_chunks)
+
+    def test_load_model(self):
+        """Test memory-mapping a compact model"""
+
+        model = CompactModel(self.tmp)
+        self.assertEqual(model.order, 3)
+        self.assertEqual(
+            sorted(model.total.items()),
+            [(1, 503), (2, 1609), (3, 2162)])
+
+        # same values as the trie-based model (float32 precision)
+        trie_model = LanguageModel(self.bin)
+        for ngram in ['le', 'le début', 'le début du', '<s>', '</s>']:
+            np.testing.assert_almost_equal(
+                trie_model.model[ngram][0],
+                model.lookup(tuple(ngram.split())), 6)
+
+        self.assertIsNone(model.lookup(('codebis',)))
+        self.assertIsNone(model.lookup(('du', 'du', 'du')))
+        self.assertIsNone(model.lookup(('le', 'début', 'du', 'corps')))
+
+        with self.assertRaises(Exception) as context:
+            CompactModel(self.bin)
+        self.assertTrue('not a compact' in str(context.exception))
+
+    def test_scores(self):
+        """Test the scores generated by the compact model"""
+
+        model = LanguageModel(self.tmp, order=5)
+        self.assertEqual(model.order, 3)
+
+        scores = [model[sequence] for sequence in self.data]
+        np.testing.assert_almost_equal(scores, self.scores, 5)
+
+        trie_model = LanguageModel(self.bin)
+        self.assertEqual(
+            trie_model.order_sequences(self.data),
+            model.order_sequences(self.data))
+
+        words = ['abstrait', 'brut', 'définition', 'codebis', 'grammique']
+        presence = [model.has_word(w) for w in words]
+        self.assertEqual([True, True, True, False, False], presence)
+
+        unigrams = dict(model.unigrams())
+        self.assertEqual(503, len(unigrams))
+        for word, logprob in trie_model.unigrams():
+            self.assertAlmostEqual(logprob, unigrams[word], 5)
+
+    def test_bounded_memory(self):
+        """Test the external sort of n-grams within a small memory budget"""
+
+        # sort the n-grams by chunks of 32 entries
+        model = ArpaLanguageModel(self.arpa, build_trie=False)
+        model.save_compact(self.tmp_chunks, memory=0.001)
+
+        self.assertTrue(
+            filecmp.cmp(self.tmp, self.tmp_chunks, shallow=False),
+            'Chunk-sorted model different from in-memory sorted model')
+
+        # the quantization codebooks do not depend on the memory budget
+        model.save_compact(self.tmp, bits=8)
+        model.save_compact(self.tmp_chunks, bits=8, memory=0.001)
+
+        self.assertTrue(
+            filecmp.cmp(self.tmp, self.tmp_chunks, shallow=False),
+            'Chunk-sorted quantized model different from in-memory one')
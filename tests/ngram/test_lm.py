@@ -1,4 +1,5 @@
 import os
+from itertools import product
 import numpy as np
 import unittest
 from ccquery.ngram import LanguageModel
@@ -60,6 +61,13 @@ class TestLM(unittest.TestCase):
             closed_model['pourquoi']
         self.assertTrue('model has no UNK token' in str(context.exception))
 
+    def test_mmap(self):
+        """Test the scores of the memory-mapped trie-based model"""
+
+        model = LanguageModel(self.mfile, order=3, mmap=True)
+        scores = [model[sequence] for sequence in self.data]
+        np.testing.assert_almost_equal(scores, self.scores, 6)
+
     def test_order(self):
         """Test the re-ordering generated by the trie-based model"""
 
@@ -79,6 +87,109 @@ class TestLM(unittest.TestCase):
         order = self.model.order_sequences(self.data)
         self.assertEqual(ref_order, order[-10:])
 
+    def test_prefix_scores(self):
+        """Test the prefix-tree scoring of multiple sequences"""
+
+        scores = self.model.score_sequences(self.data)
+        self.assertEqual(list(scores.keys()), self.data)
+        np.testing.assert_almost_equal(
+            list(scores.values()), self.scores, 6)
+
+        self.assertEqual(
+            self.model.order_sequences(self.data),
+            self.model.order_sequences(self.data, prefix_tree=False))
+
+    def test_states(self):
+        """Test the state-based incremental scoring"""
+
+        for sequence in self.data:
+            score, state = 0, self.model.null_state()
+            for word in sequence.split():
+                logprob, state = self.model.score_state(state, word)
+                score += logprob
+                self.assertTrue(len(state) < self.model.order)
+            self.assertEqual(self.model[sequence], score)
+
+        # the state holds the longest matched context
+        _, state = self.model.score_state(('le',), 'début')
+        self.assertEqual(('le', 'début'), state)
+        _, state = self.model.score_state(('le', 'début'), 'du')
+        self.assertEqual(('début', 'du'), state)
+        _, state = self.model.score_state(('début', 'du'), 'pourquoi')
+        self.assertEqual((), state)
+
+        # start-of-sentence context
+        score, state = 0, self.model.begin_state()
+        self.assertEqual(('<s>',), state)
+        for word in ['le', 'début', 'du', 'corps', '</s>']:
+            logprob, state = self.model.score_state(state, word)
+            score += logprob
+        self.assertAlmostEqual(
+            self.model.score_sentence('le début du corps'), score, 6)
+
+    def test_batch_scores(self):
+        """Test the vectorized scoring of a batch of sequences"""
+
+        scores = self.model.score_batch(self.data)
+        self.assertIsInstance(scores, np.ndarray)
+        np.testing.assert_almost_equal(scores, self.scores, 6)
+
+        # unknown words, tuples, empty sequences and empty batches
+        scores = self.model.score_batch(
+            ['pourquoi', ('le', 'pourquoi', 'du'), '', 'le début'])
+        np.testing.assert_almost_equal(
+            [self.model['pourquoi'], self.model['le pourquoi du'],
+             0, self.model['le début']],
+            scores, 6)
+        self.assertEqual(0, len(self.model.score_batch([])))
+
+    def test_lattice(self):
+        """Test the beam-search decoding of a lattice of alternatives"""
+
+        lattice = [['le', 'du'], ['début', 'corps', 'cube'], ['du', 'le']]
+        sequences = [' '.join(p) for p in product(*lattice)]
+        scores = self.model.score_sequences(sequences)
+
+        # a wide beam keeps all the hypotheses
+        decoded = self.model.decode_lattice(lattice, beam_width=100)
+        self.assertEqual(sorted(sequences), sorted(decoded))
+        np.testing.assert_almost_equal(
+            [scores[s] for s in decoded],
+            sorted(scores.values(), reverse=True), 6)
+
+        # a narrow beam keeps only the best hypotheses
+        decoded = self.model.decode_lattice(lattice, beam_width=2)
+        self.assertEqual(2, len(decoded))
+        self.assertTrue(set(decoded) < set(sequences))
+        self.assertEqual(decoded, self.model.order_sequences(decoded))
+
+        # multi-word alternatives are scored word by word
+        decoded = self.model.decode_lattice([['le début'], ['du']])
+        self.assertEqual(['le début du'], decoded)
+
+    def test_cache(self):
+        """Test the bounded cache of n-gram lookups"""
+
+        self.assertIsNone(self.model.cache_info())
+
+        cached_model = LanguageModel(self.mfile, cache_size=100)
+        scores = [cached_model[sequence] for sequence in self.data]
+        np.testing.assert_almost_equal(scores, self.scores, 6)
+
+        info = cached_model.cache_info()
+        self.assertEqual(100, info.maxsize)
+        self.assertTrue(info.currsize <= 100)
+        misses = info.misses
+
+        # rescoring the same sequences only hits the cache
+        scores = [cached_model[sequence] for sequence in self.data[-5:]]
+        np.testing.assert_almost_equal(scores, self.scores[-5:], 6)
+        self.assertEqual(misses, cached_model.cache_info().misses)
+        self.assertTrue(cached_model.cache_info().hits > info.hits)
+
+        cached_model.clear_cache()
+        self.assertEqual(0, cached_model.cache_info().currsize)
+
     def test_words(self):
         """Test for words presence"""
 
@@ -86,6 +197,15 @@ class TestLM(unittest.TestCase):
         presence = [self.model.has_word(w) for w in words]
         self.assertEqual([True, True, True, False, False], presence)
 
+    def test_unigrams(self):
+        """Test iterating over the unigrams of the model"""
+
+        unigrams = dict(LanguageModel(self.mfile, cache_size=10).unigrams())
+        self.assertEqual(503, len(unigrams))
+        self.assertAlmostEqual(-2.445604, unigrams['a'], 6)
+        self.assertTrue('<s>' in unigrams)
+        self.assertFalse('le début' in unigrams)
+
     def test_sentence(self):
         """Test for sentences with bos and eos"""
 
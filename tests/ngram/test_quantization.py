@@ -0,0 +1,89 @@
+import os
+import unittest
+import numpy as np
+from ccquery.ngram import ArpaLanguageModel, LanguageModel, quantization
+from ccquery.utils import io_utils
+
+class TestQuantization(unittest.TestCase):
+    """Test the quantization of n-gram language models"""
+
+    def setUp(self):
+        """Set up local variables"""
+
+        self.arpa = os.path.join(os.path.dirname(__file__), 'sample-model.arpa')
+        self.bin = io_utils.change_extension(self.arpa, 'bin')
+        self.tmp = io_utils.change_extension(self.arpa, 'tmp.bin')
+        self.ctmp = io_utils.change_extension(self.arpa, 'tmp.cbin')
+        self.sequences = os.path.join(
+            os.path.dirname(__file__), 'sample-sentences.txt')
+
+        io_utils.check_file_readable(self.arpa)
+        io_utils.check_file_readable(self.bin)
+
+    def tearDown(self):
+        """Remove temporary files"""
+        io_utils.delete_file(self.tmp)
+        io_utils.delete_file(self.ctmp)
+        io_utils.delete_file(quantization.codebook_path(self.tmp))
+
+    def test_codebook(self):
+        """Test the definition of codebooks"""
+
+        # less values than bins: keep the values
+        values = [0.0, -1.5, -1.5, -2.25, 0.0]
+        codebook = quantization.build_codebook(values, 8)
+        np.testing.assert_equal([-2.25, -1.5, 0.0], codebook)
+        codes = quantization.encode(values, codebook)
+        np.testing.assert_equal(values, codebook[codes])
+
+        # more values than bins: equal-size bins
+        values = np.linspace(-10, 0, 1000)
+        codebook = quantization.build_codebook(values, 8)
+        self.assertEqual(256, len(codebook))
+        codes = quantization.encode(values, codebook)
+        self.assertEqual(np.uint8, codes.dtype)
+        self.assertTrue(np.abs(codebook[codes] - values).max() < 0.03)
+
+        with self.assertRaises(Exception) as context:
+            quantization.build_codebook(values, 4)
+        self.assertTrue('Quantization expects' in str(context.exception))
+
+    def test_trie_model(self):
+        """Test the quantized trie-based model"""
+
+        model = ArpaLanguageModel(self.arpa, build_trie=False)
+        model.save_trie(self.tmp, bits=8)
+        io_utils.check_file_readable(quantization.codebook_path(self.tmp))
+
+        qmodel = LanguageModel(self.tmp, header='<BB')
+        rmodel = LanguageModel(self.bin)
+
+        with open(self.sequences, encoding='utf-8') as istream:
+            sequences = [line.strip() for line in istream]
+
+        # small quantization error
+        qscores = [qmodel[seq] for seq in sequences]
+        rscores = [rmodel[seq] for seq in sequences]
+        np.testing.assert_almost_equal(qscores, rscores, 1)
+
+        # exact values when the codebooks keep all the distinct values
+        model.save_trie(self.tmp, bits=16)
+        qmodel = LanguageModel(self.tmp, header='<HH')
+        qscores = [qmodel[seq] for seq in sequences]
+        np.testing.assert_almost_equal(qscores, rscores, 5)
+
+    def test_compact_model(self):
+        """Test the quantized compact model"""
+
+        model = ArpaLanguageModel(self.arpa, build_trie=False)
+        model.save_compact(self.ctmp, bits=16)
+
+        qmodel = LanguageModel(self.ctmp)
+        rmodel = LanguageModel(self.bin)
+        self.assertEqual(
+            np.uint16, qmodel.model.probs[3].dtype)
+
+        for ngram in ['le', 'le début', 'le début du', '<s>', '</s>']:
+            np.testing.assert_almost_equal(
+                rmodel.model[ngram][0],
+                qmodel.model.lookup(tuple(ngram.split())), 5)
@@ -0,0 +1,74 @@
+import os
+import unittest
+from ccquery.spacy import Gazetteer
+from ccquery.utils import io_utils
+
+class TestGazetteer(unittest.TestCase):
+    """Test the detection of named entities with a gazetteer"""
+
+    def setUp(self):
+        """Set up local variables"""
+
+        self.entities = [
+            'Paris',
+            'Paris Saint-Germain',
+            'la tour eiffel',
+            'tour de france',
+            'Jumanji',
+        ]
+        self.gazetteer = Gazetteer(entities=self.entities)
+        self.temp = os.path.join(
+            os.path.dirname(__file__), 'sample-gazetteer.marisa')
+
+    def tearDown(self):
+        """Remove temporary variables"""
+        io_utils.delete_file(self.temp)
+
+    def test_load(self):
+        """Test the loaded surface forms"""
+
+        self.assertEqual(5, len(self.gazetteer))
+        self.assertEqual(3, self.gazetteer.max_tokens)
+        self.assertTrue('paris saint-germain' in self.gazetteer)
+        self.assertFalse('Paris' in self.gazetteer)
+
+        with self.assertRaises(Exception) as context:
+            Gazetteer()
+        self.assertTrue('expects' in str(context.exception))
+
+    def test_flag(self):
+        """Test the longest-match scan"""
+
+        tokens = 'billet paris saint-germain tour de france'.split()
+        self.assertEqual([(1, 3), (3, 6)], self.gazetteer.match(tokens))
+        self.assertEqual([0, 1, 1, 1, 1, 1], self.gazetteer.flag(tokens))
+
+        # partial surface forms do not match
+        tokens = 'la tour de paris'.split()
+        self.assertEqual([0, 0, 0, 1], self.gazetteer.flag(tokens))
+
+        # token boundaries
+        tokens = 'parisien jumanji 2'.split()
+        self.assertEqual([0, 1, 0], self.gazetteer.flag(tokens))
+        self.assertEqual([], self.gazetteer.flag([]))
+
+    def test_tokenizer(self):
+        """Test the tokenization of the surface forms"""
+
+        gazetteer = Gazetteer(
+            entities=['Paris Saint-Germain'],
+            tokenizer=lambda text: text.replace('-', ' - ').split())
+        self.assertEqual(
+            [0, 1, 1, 1, 1],
+            gazetteer.flag(['billet', 'paris', 'saint', '-', 'germain']))
+
+    def test_save(self):
+        """Test saving and memory-mapping the trie"""
+
+        self.gazetteer.save(self.temp)
+        gazetteer = Gazetteer(self.temp)
+
+        self.assertEqual(5, len(gazetteer))
+        self.assertEqual(3, gazetteer.max_tokens)
+        tokens = 'billet paris saint-germain tour de france'.split()
+        self.assertEqual(self.gazetteer.flag(tokens), gazetteer.flag(tokens))
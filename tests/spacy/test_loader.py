@@ -1,5 +1,5 @@
 import unittest
-from ccquery.spacy import SpacyLoader
+from ccquery.spacy import SpacyLoader, Gazetteer
 
 class TestSpacyLoader(unittest.TestCase):
     """Test the performance evaluation of automation corrections"""
@@ -18,6 +18,8 @@ class TestSpacyLoader(unittest.TestCase):
         self.subtest_pipeline()
         self.subtest_tokenize()
         self.subtest_split_and_flag()
+        self.subtest_split_and_flag_batch()
+        self.subtest_tokenizer_only()
 
     def subtest_bad_load(self):
         """Test loading an unknown model"""
@@ -93,3 +95,46 @@ class TestSpacyLoader(unittest.TestCase):
 
         self.assertEqual(rtokens, tokens)
         self.assertEqual(rflags, ignore_flags)
+
+    def subtest_split_and_flag_batch(self):
+        """Test the batched tokenizer"""
+
+        queries = [
+            'comment rehoindre une force',
+            'fenêtre coulissante alu ou pvc?',
+            'au cœur de l\'histoire',
+            'acteur jumanji 2017',
+            'comment rehoindre une force',
+        ]
+        references = [self.nlp.split_and_flag(query) for query in queries]
+
+        self.assertEqual(references, self.nlp.split_and_flag_batch(queries))
+        self.assertEqual(
+            references,
+            self.nlp.split_and_flag_batch(queries, batch_size=2, n_process=2))
+        self.assertEqual([], self.nlp.split_and_flag_batch([]))
+
+    def subtest_tokenizer_only(self):
+        """Test the tokenizer-only mode, with a gazetteer"""
+
+        nlp = SpacyLoader('fr_core_news_sm', tokenizer_only=True)
+        self.assertFalse(nlp.check_pipe('tagger'))
+
+        queries = [
+            'fenêtre coulissante alu ou pvc?',
+            'acteur jumanji 2017',
+            'carrousel rouge nantes',
+        ]
+        references = [self.nlp.split_and_flag(query) for query in queries]
+
+        self.assertEqual(
+            references, [nlp.split_and_flag(query) for query in queries])
+        self.assertEqual(references, nlp.split_and_flag_batch(queries))
+
+        nlp.set_gazetteer(Gazetteer(entities=['Jumanji', 'Nantes']))
+        self.assertEqual(
+            [[0, 0, 0, 0, 0, 1], [0, 1, 1], [0, 0, 1]],
+            [nlp.split_and_flag(query)[1] for query in queries])
+        self.assertEqual(
+            [[0, 0, 0, 0, 0, 1], [0, 1, 1], [0, 0, 1]],
+            [flags for _, flags in nlp.split_and_flag_batch(queries)])
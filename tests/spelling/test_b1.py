@@ -1,5 +1,7 @@
 import os
+import time
 import unittest
+from ccquery.error import ConfigError
 from ccquery.utils import io_utils
 from ccquery.spelling import B1Correction
 
@@ -20,6 +22,10 @@ class TestBaseline1(unittest.TestCase):
         io_utils.check_file_readable(dic)
         io_utils.check_file_readable(ngram)
 
+        self.dic, self.aff = dic, aff
+        self.vocab = os.path.join(
+            os.path.dirname(__file__), '..', 'preprocessing', 'sample-vocab.txt')
+
         # load baseline
         self.model = B1Correction()
         self.model.load_spacy(nlp, disable=['ner', 'parser'])
@@ -56,3 +62,271 @@ class TestBaseline1(unittest.TestCase):
             solutions.append(candidates[0])
 
         self.assertEqual(refs, solutions)
+
+    def test_batch(self):
+        """Test the batch correction of queries"""
+
+        queries = [
+            'comment rehoindre une force',
+            'meilleur voeu en portugais',
+            'serrue en applique',
+            'comment rehoindre une force',
+            'pain de mie japonaid',
+            'dance polynesienne',
+        ]
+
+        for beam_width in [None, 3]:
+            self.model.beam_width = beam_width
+
+            refs = [self.model.correct(query, topn=3) for query in queries]
+            self.assertEqual(refs, self.model.correct_batch(queries, topn=3))
+            self.assertEqual(refs, self.model.correct_batch(
+                queries, topn=3, batch_size=2, n_process=2))
+
+        self.assertEqual([], self.model.correct_batch([]))
+
+        # stage durations of each batch (5 batches, 2 without beam search)
+        timings = self.model.stats()['batch_timings']
+        self.assertEqual(5, timings['total']['count'])
+        self.assertEqual(2, timings['expand']['count'])
+        self.assertEqual(5, timings['score']['count'])
+
+    def test_fast_path(self):
+        """Test the queries without misspelled tokens"""
+
+        queries = [
+            'le début du corps',
+            'comment rehoindre une force',
+            "l' histoire de la forme",
+            'le début du corps',
+        ]
+
+        refs = [self.model.correct(query, topn=3) for query in queries]
+        self.assertEqual(['le début du corps'], refs[0])
+        self.assertEqual(["l'histoire de la forme"], refs[2])
+        stats = self.model.stats()
+        self.assertEqual(
+            (4, 3, 0.75),
+            (stats['queries'], stats['fast_path'], stats['fast_path_ratio']))
+
+        # same results through the full pipeline
+        self.model.fast_path = False
+        self.assertEqual(
+            refs, [self.model.correct(query, topn=3) for query in queries])
+        self.assertEqual(refs, self.model.correct_batch(queries, topn=3))
+        self.assertEqual(3, self.model.stats()['fast_path'])
+
+        self.model.fast_path = True
+        self.assertEqual(refs, self.model.correct_batch(queries, topn=3))
+        stats = self.model.stats()
+        self.assertEqual(
+            (16, 6, 0.375),
+            (stats['queries'], stats['fast_path'], stats['fast_path_ratio']))
+
+    def test_details(self):
+        """Test the per-stage timings"""
+
+        stages = ['tokenize', 'detect', 'suggest', 'expand', 'score',
+                  'postprocess', 'total']
+
+        candidates, details = self.model.correct_with_details(
+            'comment rehoindre une force', topn=2)
+        self.assertEqual(
+            self.model.correct('comment rehoindre une force', topn=2),
+            candidates)
+        self.assertFalse(details['fast_path'])
+        self.assertTrue(details['candidates'] >= len(candidates))
+        self.assertEqual(sorted(stages), sorted(details['timings']))
+
+        # the fast path only tokenizes, detects and post-processes
+        _, details = self.model.correct_with_details('le début du corps')
+        self.assertTrue(details['fast_path'])
+        self.assertEqual(1, details['candidates'])
+        self.assertEqual(
+            ['detect', 'postprocess', 'tokenize', 'total'],
+            sorted(details['timings']))
+
+        # the beam search expands and scores the candidates at once
+        self.model.beam_width = 3
+        _, details = self.model.correct_with_details('serrue en applique')
+        self.assertFalse('expand' in details['timings'])
+        self.assertTrue(details['candidates'] <= 3)
+
+        stats = self.model.stats()
+        self.assertEqual(4, stats['queries'])
+        self.assertEqual(4, stats['timings']['total']['count'])
+        self.assertEqual(3, stats['timings']['score']['count'])
+        self.assertEqual(2, stats['timings']['expand']['count'])
+        self.assertEqual(4, stats['candidates']['count'])
+
+        self.model.clear_stats()
+        self.assertEqual(0, self.model.stats()['queries'])
+        self.assertEqual(0, self.model.stats()['timings']['total']['count'])
+
+    def test_budget(self):
+        """Test the degradation levels of the time budget"""
+
+        query = 'comment rehoindre une force'
+        tokens, flags = self.model.nlp.split_and_flag(query)
+        lattice = self.model.hunspell.suggest(
+            tokens, self.model.hunspell.detect(tokens, ignore=flags))
+        full = 1
+        for words in lattice:
+            full *= len(words)
+        self.assertTrue(full > 2)
+
+        def correct(budget):
+            # one second per candidate
+            self.model.candidate_cost = 1.0
+            return self.model.correct_with_details(
+                query, topn=10, budget=budget)
+
+        self.model.degraded_suggestions = 1
+        self.assertEqual(
+            self.model.correct(query, topn=10), correct(full + 0.5)[0])
+        self.assertEqual('full', correct(full + 0.5)[1]['degradation'])
+        self.assertEqual('fewer_suggestions', correct(1.5)[1]['degradation'])
+
+        candidates, details = correct(0.5)
+        self.assertEqual('no_rerank', details['degradation'])
+        self.assertEqual(
+            [' '.join(words[0] for words in lattice)], candidates)
+
+        candidates, details = correct(1e-9)
+        self.assertEqual('unchanged', details['degradation'])
+        self.assertEqual([query], candidates)
+        self.assertFalse('suggest' in details['timings'])
+
+        # deadline exceeded while suggesting the corrections of the tokens
+        suggest = self.model.hunspell.suggest
+
+        def slow_suggest(tokens, misspelled):
+            time.sleep(0.05)
+            return suggest(tokens, misspelled)
+
+        self.model.hunspell.suggest = slow_suggest
+        try:
+            candidates, details = correct(0.12)
+        finally:
+            del self.model.hunspell.suggest
+        self.assertEqual('unchanged', details['degradation'])
+        self.assertEqual([query], candidates)
+        self.assertTrue(details['timings']['suggest'] < 0.2)
+
+        # beam search with a smaller beam
+        self.model.beam_width = 5
+        self.model.degraded_suggestions = 2
+        self.model.degraded_beam_width = 1
+        small = sum(min(len(words), 2) for words in lattice)
+        candidates, details = correct(small + 0.5)
+        self.assertEqual('small_beam', details['degradation'])
+        self.assertEqual(1, len(candidates))
+
+        stats = self.model.stats()['degradation']
+        self.assertEqual(
+            {'full': 3, 'fewer_suggestions': 1, 'small_beam': 1,
+             'no_rerank': 1, 'unchanged': 2}, stats)
+
+        # the beam search also updates the average cost per candidate
+        self.model.candidate_cost = 1.0
+        self.model.correct(query)
+        self.assertTrue(self.model.candidate_cost < 1.0)
+
+    def test_load_config(self):
+        """Test loading the models from a configuration dictionary"""
+
+        folder = os.path.dirname(__file__)
+
+        model = B1Correction()
+        model.load_config({
+            'spacy': {'model': 'fr_core_news_sm', 'disable': ['ner']},
+            'hunspell': {
+                'dic': os.path.join(folder, 'index.dic'),
+                'aff': os.path.join(folder, 'index.aff')},
+            'ngram': {
+                'model': os.path.join(
+                    folder, '..', 'ngram', 'sample-model.bin'),
+                'beam_width': 3},
+            'suggester': {'name': 'symspell', 'kwargs': {'path': self.vocab}},
+        })
+
+        self.assertEqual(3, model.beam_width)
+        self.assertTrue(model.hunspell.suggester is not None)
+        self.assertEqual(
+            ['hunspell', 'ngram', 'spacy', 'suggester'],
+            sorted(model.load_times))
+
+    def test_metrics(self):
+        """Test the exposition of the correction metrics"""
+
+        self.model.correct('comment rehoindre une force')
+        self.model.correct('le début du corps')
+
+        text = self.model.metrics(
+            caches=[({'cache': 'api'}, {'hits': 3, 'misses': 1})]).render()
+        lines = text.splitlines()
+
+        self.assertTrue('ccquery_corrected_queries_total 2' in lines)
+        self.assertTrue('ccquery_fast_path_queries_total 1' in lines)
+        self.assertTrue(
+            'ccquery_stage_duration_seconds_count{stage="total"} 2' in lines)
+        self.assertTrue(
+            'ccquery_stage_duration_seconds_bucket'
+            '{stage="suggest",le="+Inf"} 1' in lines)
+        self.assertTrue('ccquery_candidates_count 2' in lines)
+        self.assertTrue('ccquery_cache_hits_total{cache="api"} 3' in lines)
+        self.assertEqual(
+            ['hunspell', 'ngram', 'spacy'], sorted(self.model.load_times))
+        self.assertTrue(
+            '# TYPE ccquery_model_load_seconds gauge' in lines)
+
+    def test_suggester(self):
+        """Test switching the candidate generator"""
+
+        with self.assertRaises(ConfigError):
+            self.model.load_suggester('unknown')
+
+        self.model.load_suggester('symspell', path=self.vocab, max_distance=1)
+        self.assertEqual(
+            [['une'], ['histoire'], ['de'], ['forme']],
+            self.model.hunspell.suggestion_lattice('une histoure de forne'))
+        self.assertEqual(
+            ['une histoire de forme'],
+            self.model.correct('une histoure de forne', topn=5))
+
+        self.model.load_suggester('automaton', use_ngram=True)
+        self.assertEqual(
+            [['une'], ['histoire'], ['de'],
+             ['forme', 'formé', 'donne', 'fonde']],
+            self.model.hunspell.suggestion_lattice('une histoure de forne'))
+
+        self.model.load_suggester('hunspell')
+        self.assertEqual(None, self.model.hunspell.suggester)
+
+    def test_precompute(self):
+        """Test pre-computing the suggestions of the queries"""
+
+        store_file = os.path.join(
+            os.path.dirname(__file__), 'sample-b1-suggestions.sqlite')
+
+        try:
+            self.model.load_hunspell(self.dic, self.aff, cache_file=store_file)
+
+            # capitalized words, words glued to a punctuation
+            added = self.model.precompute_suggestions(
+                ['Comment REHOINDRE une force?', 'serrue, en applique'])
+            self.assertLessEqual(2, added)
+            self.assertEqual(added, len(self.model.hunspell.store))
+            self.assertEqual(
+                0, self.model.precompute_suggestions(['rehoindre serrue']))
+
+            # every misspelled word of the corrections is a store hit
+            self.model.correct('comment rehoindre une force', topn=1)
+            self.model.correct('serrue en applique', topn=1)
+            info = self.model.hunspell.cache_info()['store']
+            self.assertEqual(added, info['hits'])
+            self.assertEqual(0, info['misses'])
+            self.model.hunspell.store.close()
+        finally:
+            for ext in ['', '-wal', '-shm']:
+                io_utils.delete_file(store_file + ext)
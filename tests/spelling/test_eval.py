@@ -39,3 +39,20 @@ class TestEvalSpelling(unittest.TestCase):
         with self.assertRaises(Exception) as context:
             evaluation.performance(1)
         self.assertTrue('No corrections available' in str(context.exception))
+
+    def test_ranking_agreement(self):
+        """Test the comparison with reference suggestions"""
+
+        evaluation = Evaluation()
+        evaluation.load_from_lists(
+            [['a', 'b', 'c'], ['b', 'a'], 'c', ['d', 'e']],
+            ['a', 'a', 'c', 'd'])
+
+        reference = [['a', 'b', 'c'], ['a', 'b'], ['c'], ['d', 'f']]
+        scores = evaluation.ranking_agreement(reference, 2)
+        self.assertEqual(scores, (75.0, 50.0, 87.5))
+
+        evaluation.load_from_list([])
+        with self.assertRaises(Exception) as context:
+            evaluation.ranking_agreement(reference, 2)
+        self.assertTrue('No corrections available' in str(context.exception))
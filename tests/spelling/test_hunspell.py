@@ -5,6 +5,12 @@ from ccquery.spelling import Evaluation
 from ccquery.utils import io_utils, str_utils
 from ccquery.data import json_controller
 
+class Suggester:
+    """Candidate generator suggesting a constant correction"""
+
+    def get_suggestions(self, word):
+        return ['test']
+
 class TestHunSpelling(unittest.TestCase):
     """Test the generation of automation corrections"""
 
@@ -71,6 +77,108 @@ class TestHunSpelling(unittest.TestCase):
             candidates = spell_checker.correct(query, topn=5)
             self.assertTrue(len(candidates) <= 5)
 
+    def test_lattice(self):
+        """Test the per-token alternatives of a query"""
+
+        spell_checker = HunSpelling(self.dic, self.aff)
+
+        lattice = spell_checker.suggestion_lattice('aide pourquoi brut')
+        self.assertEqual(3, len(lattice))
+        self.assertEqual(['aide'], lattice[0])
+        self.assertEqual(['brut'], lattice[2])
+
+        # ignored tokens are kept as they are
+        lattice = spell_checker.suggestion_lattice(
+            'aide pourquoi brut', ignore=[0, 1, 0])
+        self.assertEqual([['aide'], ['pourquoi'], ['brut']], lattice)
+
+        # the candidates combine the alternatives of each token
+        candidates = spell_checker.correct('pourquoi ville')
+        lattice = spell_checker.suggestion_lattice('pourquoi ville')
+        self.assertEqual(len(lattice[0]) * len(lattice[1]), len(candidates))
+
+    def test_lattices(self):
+        """Test the per-token alternatives of several queries"""
+
+        spell_checker = HunSpelling(self.dic, self.aff)
+
+        queries = ['aide pourquoi brut', 'pourquoi ville', 'pourquoi pas']
+        ignores = [[0, 0, 0], [1, 0], [0, 0]]
+
+        self.assertEqual(
+            [spell_checker.suggestion_lattice(query, ignore=ignore)
+             for query, ignore in zip(queries, ignores)],
+            spell_checker.suggestion_lattices(queries, ignores=ignores))
+        self.assertEqual(
+            [spell_checker.suggestion_lattice(query) for query in queries],
+            spell_checker.suggestion_lattices(queries))
+
+    def test_cache(self):
+        """Test the in-memory and persistent suggestion caches"""
+
+        store_file = os.path.join(
+            os.path.dirname(__file__), 'sample-suggestions.sqlite')
+
+        try:
+            spell_checker = HunSpelling(
+                self.dic, self.aff, cache_size=10, cache_file=store_file)
+            reference = HunSpelling(self.dic, self.aff)
+
+            self.assertEqual(
+                reference.get_suggestions('pourquoi'),
+                spell_checker.get_suggestions('pourquoi'))
+            self.assertEqual(
+                reference.get_suggestions('pourquoi'),
+                spell_checker.get_suggestions('pourquoi'))
+
+            info = spell_checker.cache_info()
+            self.assertEqual(1, info['memory']['hits'])
+            self.assertEqual(1, info['memory']['misses'])
+            self.assertEqual(1, info['store']['size'])
+
+            # pre-populate the store, reuse it in a new instance
+            spell_checker.precompute_suggestions(['ville', 'aide', 'ville'])
+            self.assertEqual(2, len(spell_checker.store))
+
+            spell_checker = HunSpelling(
+                self.dic, self.aff, cache_file=store_file)
+            self.assertEqual(
+                reference.get_suggestions('ville'),
+                spell_checker.get_suggestions('ville'))
+            self.assertEqual(1, spell_checker.cache_info()['store']['hits'])
+            self.assertEqual(None, spell_checker.cache_info()['memory'])
+
+            # changing the dictionary changes the keys of the stored
+            # suggestions, the other suggestions are kept
+            fingerprint = spell_checker.fingerprint
+            spell_checker.add_word('ville')
+            self.assertNotEqual(fingerprint, spell_checker.fingerprint)
+            self.assertEqual(2, len(spell_checker.store))
+
+            spell_checker.get_suggestions('pourquoi')
+            self.assertEqual(1, spell_checker.cache_info()['store']['misses'])
+            self.assertEqual(3, len(spell_checker.store))
+
+            # clearing only removes the suggestions of the current dictionary
+            spell_checker.clear_cache()
+            self.assertEqual(2, len(spell_checker.store))
+
+            # the suggestions of each candidate generator are kept apart
+            spell_checker.get_suggestions('pourquoi')
+            spell_checker.set_suggester(Suggester(), backend='test')
+            self.assertEqual(['test'], spell_checker.get_suggestions('pourquoi'))
+            self.assertEqual(4, len(spell_checker.store))
+
+            spell_checker.set_suggester(None)
+            self.assertEqual(
+                reference.get_suggestions('pourquoi'),
+                spell_checker.get_suggestions('pourquoi'))
+            self.assertEqual(4, len(spell_checker.store))
+            spell_checker.store.close()
+        finally:
+            for ext in ['', '-wal', '-shm']:
+                io_utils.delete_file(store_file + ext)
+
     def test_eval_suggestions(self):
         """Test the evaluation of automatic spelling corrections"""
 
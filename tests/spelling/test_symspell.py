@@ -0,0 +1,47 @@
+import os
+import unittest
+from ccquery.error import ConfigError
+from ccquery.spelling import SymSpelling
+from ccquery.utils import io_utils
+
+class TestSymSpelling(unittest.TestCase):
+    """Test the symmetric deletion candidate generator"""
+
+    def setUp(self):
+        """Set up local variables"""
+
+        self.vocab = os.path.join(
+            os.path.dirname(__file__), '..', 'preprocessing', 'sample-vocab.txt')
+        io_utils.check_file_readable(self.vocab)
+
+    def test_load(self):
+        """Test loading the vocabulary"""
+
+        with self.assertRaises(ConfigError):
+            SymSpelling()
+
+        with self.assertRaises(ConfigError):
+            SymSpelling(self.vocab, max_distance=3, prefix_length=3)
+
+        speller = SymSpelling(self.vocab)
+        self.assertTrue('abstrait' in speller.counts)
+
+    def test_suggestions(self):
+        """Test the suggestions within the maximum edit distance"""
+
+        speller = SymSpelling(counts={
+            'force': 10, 'forme': 30, 'forte': 5, 'fort': 20, 'rejoindre': 3})
+
+        self.assertEqual(
+            [('force', 0, 10), ('forme', 1, 30), ('forte', 1, 5),
+             ('fort', 2, 20)],
+            speller.lookup('force'))
+        self.assertEqual(
+            ['force', 'forme', 'forte'],
+            [sgt for sgt, _, _ in speller.lookup('force', max_distance=1)])
+        self.assertEqual(['rejoindre'], speller.get_suggestions('rehoindre'))
+        self.assertEqual(['rejoindre'], speller.get_suggestions('erjoindre'))
+        self.assertEqual([], speller.get_suggestions('xyz'))
+
+        speller.max_suggestions = 2
+        self.assertEqual(['force', 'forme'], speller.get_suggestions('force'))
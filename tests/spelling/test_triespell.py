@@ -0,0 +1,76 @@
+import os
+import unittest
+from ccquery.error import ConfigError
+from ccquery.ngram import LanguageModel
+from ccquery.spelling import TrieSpelling
+from ccquery.utils import io_utils
+from ccquery.utils.str_utils import edit_distance
+
+class TestTrieSpelling(unittest.TestCase):
+    """Test the Levenshtein automaton over a trie of the vocabulary"""
+
+    def setUp(self):
+        """Set up local variables"""
+
+        self.vocab = os.path.join(
+            os.path.dirname(__file__), '..', 'preprocessing', 'sample-vocab.txt')
+        self.ngram = os.path.join(
+            os.path.dirname(__file__), '..', 'ngram', 'sample-model.bin')
+
+        io_utils.check_file_readable(self.vocab)
+        io_utils.check_file_readable(self.ngram)
+
+    def test_load(self):
+        """Test loading the vocabulary"""
+
+        with self.assertRaises(ConfigError):
+            TrieSpelling()
+
+        speller = TrieSpelling(self.vocab)
+        self.assertEqual(500, len(speller.trie))
+        self.assertEqual(None, speller.prior('codebis'))
+
+        # unigram priors of the language model (without special tokens)
+        speller = TrieSpelling(language_model=self.ngram)
+        self.assertEqual(500, len(speller.trie))
+        self.assertAlmostEqual(-2.445604, speller.prior('a'), 6)
+        self.assertEqual(None, speller.prior('<s>'))
+
+    def test_suggestions(self):
+        """Test the suggestions within the maximum edit distance"""
+
+        speller = TrieSpelling(counts={
+            'force': 10, 'forme': 30, 'forte': 5, 'fort': 20, 'rejoindre': 3})
+
+        self.assertEqual(
+            ['force', 'forme', 'forte', 'fort'],
+            [sgt for sgt, _, _ in speller.lookup('force')])
+        self.assertEqual(
+            [0, 1, 1, 2], [dist for _, dist, _ in speller.lookup('force')])
+        self.assertAlmostEqual(
+            speller.prior('forme'), speller.lookup('force')[1][2])
+
+        self.assertEqual(['rejoindre'], speller.get_suggestions('rehoindre'))
+        self.assertEqual(['rejoindre'], speller.get_suggestions('erjoindre'))
+        self.assertEqual(['rejoindre'], speller.get_suggestions('rejoinder'))
+        self.assertEqual([], speller.get_suggestions('xyz'))
+
+        speller.max_suggestions = 2
+        self.assertEqual(['force', 'forme'], speller.get_suggestions('force'))
+
+    def test_exhaustive(self):
+        """Test the automaton against the edit distance of every word"""
+
+        speller = TrieSpelling(language_model=LanguageModel(self.ngram))
+        words = list(speller.trie.keys())
+
+        for query in ['débt', 'grammatique', 'defintion', 'corsp', 'lse']:
+            for max_distance in [1, 2]:
+                expected = sorted(
+                    (word, edit_distance(query, word, max_distance))
+                    for word in words
+                    if edit_distance(query, word, max_distance) <= max_distance)
+                found = sorted(
+                    (word, dist) for word, dist, _
+                    in speller.lookup(query, max_distance))
+                self.assertEqual(expected, found)
@@ -0,0 +1,150 @@
+import os
+import time
+import unittest
+from multiprocessing import Process
+from ccquery.utils import io_utils
+from ccquery.utils.cache_utils import \
+    LRUCache, LFUCache, PersistentCache, create_cache
+
+def fill_store(path, key, value):
+    """Store a value from another process"""
+    PersistentCache(path).put(key, value)
+
+class TestCache(unittest.TestCase):
+    """Test the in-memory and persistent caches"""
+
+    def setUp(self):
+        """Set up local variables"""
+        self.store_file = os.path.join(
+            os.path.dirname(__file__), 'sample-cache.sqlite')
+
+    def tearDown(self):
+        """Delete local files"""
+        for ext in ['', '-wal', '-shm']:
+            io_utils.delete_file(self.store_file + ext)
+
+    def test_lru(self):
+        """Evict the least recently used entries"""
+
+        cache = LRUCache(2)
+        cache.put('a', [1])
+        cache.put('b', [2])
+
+        # 'a' becomes the most recently used entry
+        self.assertEqual([1], cache.get('a'))
+        cache.put('c', [3])
+
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(2, len(cache))
+
+        self.assertEqual({
+            'hits': 1, 'misses': 1, 'hit_rate': 0.5,
+            'evictions': 1, 'expirations': 0, 'size': 2, 'maxsize': 2},
+            cache.stats())
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.stats()['hits'])
+
+    def test_lfu(self):
+        """Evict the least frequently used entries"""
+
+        cache = LFUCache(2)
+        cache.put('a', [1])
+        cache.put('b', [2])
+
+        # 'a' is used twice, 'b' once
+        self.assertEqual([1], cache.get('a'))
+        self.assertEqual([2], cache.get('b'))
+        self.assertEqual([1], cache.get('a'))
+        cache.put('c', [3])
+
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+
+        # the least recently used entry among the least frequently used
+        cache.get('c')
+        cache.get('c')
+        cache.put('d', [4])
+        self.assertEqual(['c', 'd'], sorted(cache.data))
+
+        self.assertEqual(2, cache.stats()['evictions'])
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        cache.put('e', [5])
+        self.assertEqual([5], cache.get('e'))
+
+    def test_ttl(self):
+        """Expire the entries after their time-to-live"""
+
+        for policy in ['lru', 'lfu']:
+            cache = create_cache(10, policy=policy, ttl=0.05)
+            cache.put('a', [1])
+            self.assertEqual([1], cache.get('a'))
+
+            time.sleep(0.1)
+            self.assertFalse('a' in cache)
+            self.assertEqual(None, cache.get('a'))
+            self.assertEqual(0, len(cache))
+
+            stats = cache.stats()
+            self.assertEqual(
+                (1, 1, 1),
+                (stats['hits'], stats['misses'], stats['expirations']))
+
+        with self.assertRaises(Exception) as context:
+            create_cache(10, policy='fifo')
+        self.assertTrue('Unknown cache policy' in str(context.exception))
+
+        with self.assertRaises(Exception) as context:
+            create_cache(0)
+        self.assertTrue('expects' in str(context.exception))
+
+    def test_persistent(self):
+        """Store values on disk, across instances and processes"""
+
+        store = PersistentCache(self.store_file)
+        self.assertEqual(None, store.get('word'))
+
+        store.put('word', ['mot', 'monde'])
+        store.update([('état', []), ('ville', ['vile'])])
+        self.assertEqual(['mot', 'monde'], store.get('word'))
+        self.assertEqual([], store.get('état'))
+        self.assertEqual(3, len(store))
+
+        # replacing a value keeps the number of entries
+        store.put('état', ['était'])
+        self.assertEqual(3, len(store))
+
+        stats = store.stats()
+        self.assertEqual(
+            (2, 1, 3), (stats['hits'], stats['misses'], stats['size']))
+        store.close()
+
+        # the values survive a restart
+        store = PersistentCache(self.store_file)
+        self.assertEqual(['vile'], store.get('ville'))
+
+        # the values stored by another process are visible
+        process = Process(
+            target=fill_store, args=(self.store_file, 'maison', ['raison']))
+        process.start()
+        process.join()
+        self.assertEqual(['raison'], store.get('maison'))
+        self.assertEqual(4, len(store))
+
+        # remove the keys of a given prefix
+        store.update([('a:mot', []), ('a%:mot', []), ('b:mot', [])])
+        store.clear(prefix='a:')
+        self.assertEqual(
+            [False, True, True],
+            [key in store for key in ['a:mot', 'a%:mot', 'b:mot']])
+        self.assertEqual(6, len(store))
+
+        store.clear()
+        self.assertEqual(0, len(store))
+        self.assertFalse('maison' in store)
+        store.close()
@@ -449,3 +449,21 @@ class TestCleanup(unittest.TestCase):
         self.assertEqual(reference1, sample1)
         self.assertEqual(reference2, sample2)
         self.assertEqual(reference3, sample3)
+
+    def test_normalize_query(self):
+        self.assertEqual(
+            'musique vietman',
+            str_utils.normalize_query('  Musique \t VIETMAN '))
+        self.assertEqual(
+            'fenêtre', str_utils.normalize_query('Fene\u0302tre'))
+
+    def test_edit_distance(self):
+        self.assertEqual(0, str_utils.edit_distance('force', 'force'))
+        self.assertEqual(1, str_utils.edit_distance('rehoindre', 'rejoindre'))
+        self.assertEqual(1, str_utils.edit_distance('japoniad', 'japonaid'))
+        self.assertEqual(3, str_utils.edit_distance('kitten', 'sitting'))
+        self.assertEqual(3, str_utils.edit_distance('', 'mie'))
+
+        # stop once the maximum distance is exceeded
+        self.assertEqual(2, str_utils.edit_distance('kitten', 'sitting', 1))
+        self.assertEqual(3, str_utils.edit_distance('a', 'pain', 2))
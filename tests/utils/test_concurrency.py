@@ -0,0 +1,129 @@
+import time
+import threading
+import unittest
+from ccquery.error import DataError
+from ccquery.utils.metric_utils import Histogram
+from ccquery.utils.concurrency_utils import SingleFlight, MicroBatcher
+
+class TestConcurrency(unittest.TestCase):
+    """Test the computations shared between threads"""
+
+    def test_single_flight(self):
+        """Compute once the concurrent calls of the same key"""
+
+        flight = SingleFlight()
+        calls = []
+
+        def compute(query):
+            calls.append(query)
+            time.sleep(0.1)
+            return query.upper()
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    flight.do('key', compute, 'query')))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(['query'], calls)
+        self.assertEqual(['QUERY'] * 5, results)
+        self.assertEqual(
+            {'executions': 1, 'coalesced': 4, 'in_flight': 0}, flight.stats())
+
+        # the next calls compute again
+        self.assertEqual('OTHER', flight.do('key', compute, 'other'))
+        self.assertEqual(2, flight.stats()['executions'])
+
+    def test_single_flight_error(self):
+        """Raise the exception of the computation to every caller"""
+
+        flight = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError('failed')
+
+        errors = []
+
+        def call():
+            try:
+                flight.do('key', fail)
+            except ValueError as exc:
+                errors.append(str(exc))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(['failed'] * 3, errors)
+        self.assertEqual(0, flight.stats()['in_flight'])
+
+    def test_micro_batcher(self):
+        """Process the concurrent items in batches"""
+
+        batches = []
+
+        def process(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=4, max_wait=0.1)
+
+        results = {}
+        threads = [
+            threading.Thread(
+                target=lambda i=i: results.update({i: batcher.submit(i)}))
+            for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({i: i * 2 for i in range(10)}, results)
+        self.assertEqual(list(range(10)), sorted(sum(batches, [])))
+        self.assertTrue(all(len(batch) <= 4 for batch in batches))
+        self.assertTrue(len(batches) < 10)
+
+        stats = batcher.stats()
+        self.assertEqual(len(batches), stats['batch_sizes']['count'])
+        self.assertEqual(10, stats['waits']['count'])
+
+        # a single item waits at most max_wait
+        tstart = time.perf_counter()
+        self.assertEqual(20, batcher.submit(10))
+        self.assertTrue(time.perf_counter() - tstart < 0.5)
+
+    def test_micro_batcher_error(self):
+        """Raise the exception of the batch to every caller"""
+
+        def fail(items):
+            raise ValueError('failed')
+
+        batcher = MicroBatcher(fail, max_wait=0)
+        with self.assertLogs('ccquery.utils.concurrency_utils', 'ERROR'):
+            with self.assertRaises(ValueError):
+                batcher.submit(1)
+
+        # the batching thread survives the failures
+        batcher.function = lambda items: items[1:]
+        with self.assertRaises(DataError):
+            batcher.submit(1)
+
+        batcher.waits = None
+        with self.assertRaises(AttributeError):
+            batcher.submit(1)
+
+        batcher.waits = Histogram()
+        batcher.function = lambda items: [2 * item for item in items]
+        self.assertEqual(4, batcher.submit(2))
+
+        with self.assertRaises(Exception) as context:
+            MicroBatcher(fail, max_batch_size=0)
+        self.assertTrue('expects' in str(context.exception))
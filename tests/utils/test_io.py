@@ -1,4 +1,7 @@
 import os
+import bz2
+import gzip
+import lzma
 import unittest
 from ccquery.utils import io_utils
 
@@ -18,6 +21,8 @@ class TestIO(unittest.TestCase):
         """Delete local file"""
         if os.path.exists(self.tmp_file):
             os.remove(self.tmp_file)
+        for ext in ['gz', 'bz2', 'xz']:
+            io_utils.delete_file(self.tmp_file + '.' + ext)
 
     def test_checkups(self):
         self.assertEqual(None, io_utils.check_file_readable(self.empty_file))
@@ -76,6 +81,9 @@ class TestIO(unittest.TestCase):
         self.assertEqual('0.0Bytes', io_utils.filesize(self.empty_file))
         self.assertEqual('11.9KB', io_utils.filesize(self.archive))
         self.assertEqual(0, io_utils.count_lines(self.empty_file))
+        self.assertEqual(
+            'da39a3ee5e6b4b0d3255bfef95601890afd80709',
+            io_utils.checksum(self.empty_file))
 
         self.assertTrue(io_utils.has_extension(self.empty_file, '.py'))
         self.assertFalse(io_utils.has_extension(self.empty_file, '.txt'))
@@ -102,3 +110,35 @@ class TestIO(unittest.TestCase):
         with self.assertRaises(Exception) as context:
             io_utils.decompress(self.empty_file, self.tmp_file)
         self.assertTrue('not a bz2 archive' in str(context.exception))
+
+    def test_open_compressed(self):
+        text = 'première ligne\nseconde ligne\n'
+
+        with open(self.tmp_file, 'w', encoding='utf-8') as ostream:
+            ostream.write(text)
+
+        archives = [self.tmp_file]
+        for ext, module in [('gz', gzip), ('bz2', bz2), ('xz', lzma)]:
+            archives.append(self.tmp_file + '.' + ext)
+            with module.open(archives[-1], 'wt', encoding='utf-8') as ostream:
+                ostream.write(text)
+
+        self.assertEqual(
+            [False, True, True, True],
+            [io_utils.is_compressed(path) for path in archives])
+        self.assertEqual(
+            [self.tmp_file] * 4,
+            [io_utils.strip_compression(path) for path in archives])
+
+        for path in archives:
+            with io_utils.open_text(path, threads=2) as istream:
+                self.assertEqual(text, istream.read())
+
+            # stop reading before the end of the file
+            with io_utils.open_text(path) as istream:
+                self.assertEqual('première ligne\n', istream.readline())
+
+        with self.assertRaises(Exception) as context:
+            with io_utils.open_text('file.txt.gz') as istream:
+                istream.read()
+        self.assertTrue('missing or not readable' in str(context.exception))
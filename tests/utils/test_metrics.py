@@ -0,0 +1,123 @@
+import time
+import unittest
+from ccquery.utils.metric_utils import Histogram, StageTimer, Exposition
+
+class TestMetrics(unittest.TestCase):
+    """Test the histograms and the stage timer"""
+
+    def test_histogram(self):
+        """Aggregate observations into buckets"""
+
+        histogram = Histogram(buckets=(1, 5, 10))
+        self.assertEqual(None, histogram.quantile(0.5))
+        self.assertEqual(None, histogram.summary()['mean'])
+
+        for value in [0.5, 1, 2, 3, 4, 6, 8, 9, 9.5, 50]:
+            histogram.observe(value)
+
+        self.assertEqual(
+            [(1, 2), (5, 5), (10, 9), (float('inf'), 10)],
+            histogram.cumulative_counts())
+
+        self.assertEqual(5, histogram.quantile(0.5))
+        self.assertEqual(10, histogram.quantile(0.9))
+        self.assertEqual(50, histogram.quantile(0.99))
+
+        counts, count, total, maximum = histogram.snapshot()
+        self.assertEqual([2, 3, 4, 1], counts)
+        self.assertEqual((10, 93.0, 50), (count, total, maximum))
+
+        summary = histogram.summary()
+        self.assertEqual(10, summary['count'])
+        self.assertEqual(93.0, summary['sum'])
+        self.assertEqual(9.3, summary['mean'])
+
+        histogram.clear()
+        self.assertEqual(0, histogram.summary()['count'])
+
+        # the quantiles do not exceed the largest observation
+        histogram.observe(0.2)
+        self.assertEqual(0.2, histogram.quantile(0.99))
+
+    def test_timer(self):
+        """Measure the stage durations"""
+
+        timer = StageTimer()
+        with timer.stage('first'):
+            time.sleep(0.01)
+        with timer.stage('second'):
+            pass
+        with timer.stage('first'):
+            time.sleep(0.01)
+
+        self.assertEqual(['first', 'second'], list(timer.timings))
+        self.assertTrue(timer.timings['first'] >= 0.02)
+        self.assertTrue(timer.timings['second'] < timer.timings['first'])
+        self.assertAlmostEqual(sum(timer.timings.values()), timer.total())
+
+    def test_exposition(self):
+        """Render the metrics in the Prometheus text format"""
+
+        histogram = Histogram(buckets=(0.5, 1))
+        for value in [0.2, 0.7, 3]:
+            histogram.observe(value)
+
+        exposition = Exposition(prefix='test')
+        exposition.counter(
+            'requests', 'Number of requests',
+            [({'endpoint': '/', 'status': 200}, 5),
+             ({'endpoint': '/batch', 'status': 400}, 1)])
+        exposition.gauge('ratio', 'Some "ratio"', 0.5)
+        exposition.histogram(
+            'duration_seconds', 'Durations', [({'stage': 'a'}, histogram)])
+        exposition.caches([
+            ({'cache': 'api'}, {'hits': 2, 'hit_rate': 0.5}),
+            ({'cache': 'store'}, {'hits': 1})])
+
+        self.assertEqual([
+            '# HELP test_requests_total Number of requests',
+            '# TYPE test_requests_total counter',
+            'test_requests_total{endpoint="/",status="200"} 5',
+            'test_requests_total{endpoint="/batch",status="400"} 1',
+            '# HELP test_ratio Some "ratio"',
+            '# TYPE test_ratio gauge',
+            'test_ratio 0.5',
+            '# HELP test_duration_seconds Durations',
+            '# TYPE test_duration_seconds histogram',
+            'test_duration_seconds_bucket{stage="a",le="0.5"} 1',
+            'test_duration_seconds_bucket{stage="a",le="1"} 2',
+            'test_duration_seconds_bucket{stage="a",le="+Inf"} 3',
+            'test_duration_seconds_sum{stage="a"} 3.9',
+            'test_duration_seconds_count{stage="a"} 3',
+            '# HELP test_cache_hits_total Number of cache hits',
+            '# TYPE test_cache_hits_total counter',
+            'test_cache_hits_total{cache="api"} 2',
+            'test_cache_hits_total{cache="store"} 1',
+            '# HELP test_cache_hit_rate Ratio of lookups found in cache',
+            '# TYPE test_cache_hit_rate gauge',
+            'test_cache_hit_rate{cache="api"} 0.5',
+        ], exposition.render().splitlines())
+
+        # the counter names end with a single '_total' suffix
+        exposition = Exposition(prefix='test')
+        exposition.counter('errors_total', 'Number of errors', 2)
+        self.assertEqual(
+            '# TYPE test_errors_total counter',
+            exposition.render().splitlines()[1])
+
+        with self.assertRaises(Exception) as context:
+            exposition.counter('errors', 'Number of errors', 2)
+        self.assertTrue('twice' in str(context.exception))
+
+        # labels added to every sample
+        exposition = Exposition(prefix='test', labels={'worker': 7})
+        exposition.counter(
+            'requests', 'Number of requests', [({'status': 200}, 5)])
+        exposition.histogram('duration_seconds', 'Durations', histogram)
+        lines = exposition.render().splitlines()
+        self.assertEqual(
+            'test_requests_total{worker="7",status="200"} 5', lines[2])
+        self.assertEqual(
+            'test_duration_seconds_bucket{worker="7",le="0.5"} 1', lines[5])
+        self.assertEqual(
+            'test_duration_seconds_count{worker="7"} 3', lines[-1])
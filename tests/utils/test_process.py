@@ -0,0 +1,68 @@
+import os
+import time
+import tempfile
+import unittest
+from ccquery.utils import process_utils
+
+class TestProcess(unittest.TestCase):
+    """Test the pre-forked workers and their memory measures"""
+
+    def test_memory_usage(self):
+        """Measure the memory of the current process"""
+
+        usage = process_utils.memory_usage()
+        if usage is None:
+            self.skipTest('no /proc file system')
+
+        self.assertTrue(usage['rss'] > 0)
+        if 'pss' in usage:
+            self.assertTrue(usage['pss'] <= usage['rss'])
+            self.assertEqual(
+                usage['rss'], usage['shared'] + usage['private'])
+
+        self.assertEqual(None, process_utils.memory_usage(pid=-1))
+
+    def test_prefork(self):
+        """Run the serve function within each worker"""
+
+        master = os.getpid()
+        with tempfile.TemporaryDirectory() as folder:
+
+            def serve():
+                time.sleep(0.2)
+                path = os.path.join(folder, str(os.getpid()))
+                with open(path, 'w') as ostream:
+                    ostream.write(' '.join(
+                        str(pid) for pid in process_utils.children(master)))
+
+            process_utils.prefork(serve, 3)
+
+            workers = sorted(os.listdir(folder))
+            self.assertEqual(3, len(workers))
+
+            # each worker sees its siblings, when /proc lists the children
+            for worker in workers:
+                with open(os.path.join(folder, worker)) as istream:
+                    siblings = istream.read().split()
+                if siblings:
+                    self.assertTrue(worker in siblings)
+
+    def test_prefork_failures(self):
+        """Restart the failing workers, give up after quick failures"""
+
+        with tempfile.TemporaryDirectory() as folder:
+
+            def serve():
+                path = os.path.join(folder, str(os.getpid()))
+                with open(path, 'w') as ostream:
+                    ostream.write('started')
+                raise ValueError('cannot serve')
+
+            with self.assertLogs('ccquery.utils.process_utils') as logs:
+                process_utils.prefork(
+                    serve, 2, max_failures=3, min_uptime=10, backoff=0.01)
+
+            # each worker started, then restarted twice
+            self.assertEqual(6, len(os.listdir(folder)))
+            self.assertEqual(
+                2, sum('not restarting' in line for line in logs.output))